@@ -15,21 +15,30 @@
 from __future__ import print_function
 
 import datetime
+import errno
 import hashlib
 import os
 import sys
 
-BLOCKSIZE = 64 * 1024
+BLOCKSIZE = 1024 * 1024
+
+try:
+    hashlib.sha256(usedforsecurity=False)
+    SHA256_ARGS = {'usedforsecurity': False}
+except TypeError:
+    SHA256_ARGS = {}
 
 
 def compute_digest(path):
-    algorithm = hashlib.sha256()
-    with open(path, 'rb') as file_:
+    algorithm = hashlib.sha256(**SHA256_ARGS)
+    buf = bytearray(BLOCKSIZE)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as file_:
         while True:
-            buf = file_.read(BLOCKSIZE)
-            if not buf:
+            count = file_.readinto(buf)
+            if not count:
                 break
-            algorithm.update(buf)
+            algorithm.update(view[:count])
     return algorithm.hexdigest()
 
 
@@ -139,8 +148,11 @@ def cmd_process():
             write_packet(digest)
             anchor_path = '.git/git-big/anchors/%s' % digest
             anchor_dir = os.path.dirname(anchor_path)
-            if not os.path.exists(anchor_dir):
+            try:
                 os.makedirs(anchor_dir)
+            except OSError as ex:
+                if ex.errno != errno.EEXIST:
+                    raise
             if os.path.join(anchor_path):
                 os.unlink(pathname)
             else:
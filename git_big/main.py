@@ -21,6 +21,8 @@ import getpass
 import hashlib
 import io
 import json
+import mmap
+import multiprocessing
 import os
 import platform
 import re
@@ -30,21 +32,42 @@ import stat
 import subprocess
 import sys
 import tempfile
+import time
 import uuid
 
 import click
 import progressbar
 import six
+from concurrent.futures import ThreadPoolExecutor
 
 import git_big.storage
 from git_big.singleton import Singlet
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from . import __version__
 
 BLOCKSIZE = 1024 * 1024
+COPY_RANGE_SIZE = 64 * BLOCKSIZE
+MMAP_WINDOW = 256 * BLOCKSIZE
+SMALL_FILE_SIZE = 256 * 1024
+INDEX_TTL = 5 * 60
+# listing costs a request per page of the whole depot, so it only beats a
+# request per unknown object once there are this many of them
+LIST_THRESHOLD = 100
 CTX_SETTINGS = dict(help_option_names=['-h', '--help'])
 DEV_NULL = io.open(os.devnull, 'w')
 IS_WIN = platform.system() == 'Windows'
+# _IOW(0x94, 9, int) from linux/fs.h
+FICLONE = 0x40049409 if sys.platform.startswith('linux') else None
 
 if IS_WIN:
     DEFAULT_CACHE_DIR = os.path.join(
@@ -53,11 +76,65 @@ else:
     DEFAULT_CACHE_DIR = os.path.expanduser('~/.cache/git-big')
 
 
+def json_loads(data):
+    """Parse JSON from bytes, using orjson when it is available"""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data.decode('utf-8'))
+
+
+# orjson only indents by two and leaves DEL and non-ASCII unescaped, so its
+# output is used only when it can be made byte-identical to json.dumps
+JSON_INDENT = re.compile(b'(?m)^ +')
+JSON_UNSAFE = re.compile(b'[^\n -~]')
+
+
+def dump_json(obj):
+    """Serialize obj as json.dumps(obj, indent=4) would, plus a newline"""
+    if orjson:
+        try:
+            data = orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+        except TypeError:
+            data = None
+        if data is not None and not JSON_UNSAFE.search(data):
+            data = JSON_INDENT.sub(lambda m: m.group(0) * 2, data)
+            return data + b'\n'
+    return json.dumps(obj, indent=4).encode() + b'\n'
+
+
+def load_json(path):
+    with io.open(path, 'rb') as file_:
+        return json_loads(file_.read())
+
+
 def git(*args):
     return subprocess.check_output(
         ['git'] + list(map(str, args)), stderr=DEV_NULL).decode()
 
 
+def git_cat_file(objects):
+    """Read the contents of many objects using a single git process"""
+    proc = subprocess.Popen(
+        ['git', 'cat-file', '--batch'],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=DEV_NULL)
+    request = ''.join('{}\n'.format(obj) for obj in objects)
+    output, _ = proc.communicate(request.encode())
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, 'git cat-file')
+    pos = 0
+    while pos < len(output):
+        eol = output.index(b'\n', pos)
+        header = output[pos:eol].decode().split()
+        pos = eol + 1
+        if len(header) != 3:
+            continue  # missing object
+        size = int(header[2])
+        yield header[0], output[pos:pos + size]
+        pos += size + 1
+
+
 def human_size(num):
     if num is None:
         return ''
@@ -95,32 +172,116 @@ else:
     fs = PosixFileSystem()
 
 
+def replace_file(src, dst):
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+        return
+    if IS_WIN and os.path.exists(dst):
+        os.unlink(dst)
+    os.rename(src, dst)
+
+
+def clone_file_data(src_file, dst_file):
+    """Share src's extents with the empty dst copy-on-write, if supported"""
+    if not fcntl or FICLONE is None:
+        return False
+    try:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+    except (IOError, OSError):
+        # e.g. not btrfs/XFS, or src and dst are on different filesystems
+        return False
+    return True
+
+
+def copy_file_data(src_file, dst_file, size, callback):
+    """Copy between open files, letting the kernel move the data if it can"""
+    if clone_file_data(src_file, dst_file):
+        callback(size)
+        return size
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        src_fd = src_file.fileno()
+        dst_fd = dst_file.fileno()
+        try:
+            while copied < size:
+                count = os.copy_file_range(src_fd, dst_fd,
+                                           min(COPY_RANGE_SIZE, size - copied))
+                if not count:
+                    break
+                copied += count
+                callback(copied)
+        except OSError as ex:
+            # e.g. unsupported by the filesystem; finish with a read loop
+            if ex.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                                errno.EOPNOTSUPP):
+                raise
+    while True:
+        buf = src_file.read(BLOCKSIZE)
+        if not buf:
+            break
+        dst_file.write(buf)
+        copied += len(buf)
+        callback(copied)
+    return copied
+
+
 @contextlib.contextmanager
 def atomic_open(dst_path, *args, **kwargs):
-    tmp_file, tmp_path = tempfile.mkstemp()
+    # stage next to dst_path so the final rename never crosses filesystems
+    dst_dir, dst_name = os.path.split(dst_path)
+    tmp_file, tmp_path = tempfile.mkstemp(
+        dir=dst_dir or '.', prefix='.{}.'.format(dst_name))
     os.close(tmp_file)
     try:
         with io.open(tmp_path, *args, **kwargs) as file_:
             yield file_
-        if IS_WIN and os.path.exists(dst_path):
-            os.unlink(dst_path)
-        try:
-            os.rename(tmp_path, dst_path)
-        except:
-            shutil.copy2(tmp_path, dst_path)
+        replace_file(tmp_path, dst_path)
     finally:
         if os.path.exists(tmp_path):
             os.unlink(tmp_path)
 
 
+def link_or_copy(src, dst):
+    """Hardlink src to dst, or clone/copy it when they are on different devices"""
+    try:
+        fs.link(src, dst)
+        return
+    except OSError as ex:
+        if ex.errno != errno.EXDEV:
+            raise
+    with io.open(src, 'rb') as src_file, atomic_open(dst, 'wb') as dst_file:
+        size = os.fstat(src_file.fileno()).st_size
+        copy_file_data(src_file, dst_file, size, lambda copied: None)
+    shutil.copystat(src, dst)
+
+
+def move_file(src, dst):
+    """Rename src to dst, falling back to link_or_copy across devices"""
+    try:
+        os.rename(src, dst)
+        return
+    except OSError as ex:
+        if ex.errno != errno.EXDEV:
+            raise
+    link_or_copy(src, dst)
+    os.unlink(src)
+
+
 class GitIndex(object):
+    # enough paths per git invocation to amortize it, few enough to stay
+    # well clear of command line length limits
+    BATCH_SIZE = 500
+
     def add(self, paths):
-        for path in paths:
-            git('add', '-f', path)
+        self._run(['add', '-f'], paths)
 
     def remove(self, paths):
-        for path in paths:
-            git('rm', path)
+        self._run(['rm'], paths)
+
+    def _run(self, args, paths):
+        paths = list(paths)
+        for i in range(0, len(paths), self.BATCH_SIZE):
+            git(*(args + ['--'] + paths[i:i + self.BATCH_SIZE]))
 
 
 class GitRepository(object):
@@ -185,24 +346,39 @@ class RepoConfig(object):
         self.files.update(other.files)
 
 
-def git_config_get(name, default=None):
+MERGE_DRIVER = 'git big merge-driver %O %A %B'
+
+
+def git_config_read():
+    """Read every setting git-big cares about using a single git process"""
     try:
-        return git('config', name).rstrip()
-    except:  # pylint: disable=W0702
-        return default
+        out = git('config', '-z', '--get-regexp',
+                  r'^(git-big\.|merge\.git-big\.driver$)')
+    except subprocess.CalledProcessError:
+        # nothing matched
+        return {}
+    values = {}
+    for item in out.split('\0'):
+        if item:
+            name, _, value = item.partition('\n')
+            values[name] = value
+    return values
 
 
 class GitConfig(object):
     def __init__(self):
-        self.uuid = git_config_get('git-big.uuid', uuid.uuid4())
-        self.cache_dir = git_config_get('git-big.cache-dir')
-        self.depot_url = git_config_get('git-big.depot.url')
-        self.depot_key = git_config_get('git-big.depot.key')
-        self.depot_secret = git_config_get('git-big.depot.secret')
+        self.__values = git_config_read()
+        self.uuid = self.__values.get('git-big.uuid', uuid.uuid4())
+        self.cache_dir = self.__values.get('git-big.cache-dir')
+        self.depot_url = self.__values.get('git-big.depot.url')
+        self.depot_key = self.__values.get('git-big.depot.key')
+        self.depot_secret = self.__values.get('git-big.depot.secret')
 
     def save(self):
-        git('config', 'git-big.uuid', self.uuid)
-        git('config', 'merge.git-big.driver', 'git big merge-driver %O %A %B')
+        if self.__values.get('git-big.uuid') != str(self.uuid):
+            git('config', 'git-big.uuid', self.uuid)
+        if self.__values.get('merge.git-big.driver') != MERGE_DRIVER:
+            git('config', 'merge.git-big.driver', MERGE_DRIVER)
 
 
 class Config(RepoConfig):
@@ -231,29 +407,58 @@ class Config(RepoConfig):
 
 
 class Entry(object):
+    """A big file as seen from the working tree, anchors, cache and depot
+
+    Stat results are remembered for the life of the entry; call invalidate()
+    after changing any of its files.
+    """
+    __slots__ = ('_depot_size', '_stats', 'rel_path', 'digest',
+                 'working_path', 'anchor_path', 'symlink_path', 'cache_path',
+                 'depot_path')
+
     def __init__(self, config, rel_path, digest):
         self._depot_size = None
+        self._stats = {}
         self.rel_path = rel_path
         self.digest = digest
         self.working_path = os.path.join(config.working_dir, self.rel_path)
-        self.anchor_path = os.path.join(config.anchors_dir, self.digest[:2],
-                                        self.digest[2:4], self.digest)
-        self.symlink_path = os.path.relpath(self.anchor_path,
-                                            os.path.dirname(self.working_path))
-        self.cache_path = os.path.join(config.objects_dir, self.digest[:2],
-                                       self.digest[2:4], self.digest)
+        object_path = os.path.join(digest[:2], digest[2:4], digest)
+        self.anchor_path = os.path.join(config.anchors_dir, object_path)
+        # the anchors live directly under working_dir, so the link just
+        # climbs out of rel_path's directories; no need for relpath()
+        parent = os.path.dirname(os.path.normpath(rel_path))
+        depth = parent.count(os.sep) + 1 if parent else 0
+        self.symlink_path = os.path.join(*([os.pardir] * depth + [
+            os.path.basename(config.anchors_dir), object_path
+        ]))
+        self.cache_path = os.path.join(config.objects_dir, object_path)
         if config.depot:
             self.depot_path = config.depot.make_path('objects', self.digest)
         else:
             self.depot_path = None
 
+    def _stat(self, path):
+        try:
+            return self._stats[path]
+        except KeyError:
+            pass
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        self._stats[path] = st
+        return st
+
+    def invalidate(self):
+        self._stats = {}
+
     @property
     def in_cache(self):
-        return os.path.exists(self.cache_path)
+        return self._stat(self.cache_path) is not None
 
     @property
     def in_anchors(self):
-        return os.path.exists(self.anchor_path)
+        return self._stat(self.anchor_path) is not None
 
     @property
     def is_link(self):
@@ -261,7 +466,7 @@ class Entry(object):
 
     @property
     def in_working(self):
-        return os.path.exists(self.working_path)
+        return self._stat(self.working_path) is not None
 
     @property
     def is_linked(self):
@@ -274,10 +479,10 @@ class Entry(object):
 
     @property
     def size(self):
-        if self.in_working:
-            return os.path.getsize(self.working_path)
-        if self.in_cache:
-            return os.path.getsize(self.cache_path)
+        for path in (self.working_path, self.cache_path):
+            st = self._stat(path)
+            if st is not None:
+                return st.st_size
         if self.in_depot:
             return self._depot_size
         return None
@@ -297,49 +502,211 @@ def make_progress_bar(name, size):
     return progressbar.ProgressBar(widgets=widgets, max_value=size)
 
 
-def compute_digest(path, rel_path):
-    algorithm = hashlib.sha256()
-    size = os.path.getsize(path)
-    with make_progress_bar(rel_path, size) as pbar:
-        with io.open(path, 'rb') as file_:
-            total_len = 0
-            while True:
-                buf = file_.read(BLOCKSIZE)
-                if not buf:
-                    break
-                algorithm.update(buf)
-                total_len += len(buf)
-                pbar.update(total_len)
+try:
+    # digests name content rather than guard secrets, so let FIPS-mode
+    # OpenSSL builds hand out their fast, non-approved implementation
+    hashlib.sha256(usedforsecurity=False)
+    SHA256_ARGS = {'usedforsecurity': False}
+except TypeError:
+    SHA256_ARGS = {}
+
+# copying an untouched context is cheaper than building one from scratch
+SHA256_TEMPLATE = hashlib.sha256(**SHA256_ARGS)
+
+
+def new_sha256():
+    return SHA256_TEMPLATE.copy()
+
+
+def _map_window(file_, offset, length):
+    mm = mmap.mmap(
+        file_.fileno(), length, access=mmap.ACCESS_READ, offset=offset)
+    if hasattr(mm, 'madvise'):
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    return mm
+
+
+def _digest_mapped(algorithm, file_, size, pbar, mm, step):
+    # walk the file one bounded window at a time so RSS stays flat
+    offset = 0
+    while True:
+        view = memoryview(mm)
+        try:
+            for pos in range(0, len(mm), step):
+                algorithm.update(view[pos:pos + step])
+                pbar.update(offset + min(pos + step, len(mm)))
+        finally:
+            view.release()
+            mm.close()
+        offset += MMAP_WINDOW
+        if offset >= size:
+            break
+        mm = _map_window(file_, offset, min(MMAP_WINDOW, size - offset))
+
+
+def _digest_stream(algorithm, file_, pbar):
+    buf = bytearray(BLOCKSIZE)
+    view = memoryview(buf)
+    total_len = 0
+    while True:
+        count = file_.readinto(buf)
+        if not count:
+            break
+        algorithm.update(view[:count])
+        total_len += count
+        pbar.update(total_len)
+
+
+def compute_digest(path, rel_path=None):
+    algorithm = new_sha256()
+    # unbuffered, so readinto fills buf straight from the kernel
+    with io.open(path, 'rb', buffering=0) as file_:
+        size = os.fstat(file_.fileno()).st_size
+        if size <= SMALL_FILE_SIZE:
+            # one read and one update; too small for a mapping or a progress
+            # bar to pay for themselves
+            algorithm.update(file_.read())
+            return algorithm.hexdigest()
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(file_.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        # hash straight out of the page cache where the platform allows it;
+        # mmap can't map empty files and py2's mmap has no memoryview
+        mm = None
+        if size and six.PY3:
+            try:
+                mm = _map_window(file_, 0, min(MMAP_WINDOW, size))
+            except (EnvironmentError, ValueError):
+                pass
+        if rel_path is None:
+            # nothing to report, so hand each window to OpenSSL in one call
+            pbar = progressbar.NullBar(max_value=size)
+            step = MMAP_WINDOW
+        else:
+            pbar = make_progress_bar(rel_path, size)
+            step = BLOCKSIZE
+        with pbar:
+            if mm is not None:
+                _digest_mapped(algorithm, file_, size, pbar, mm, step)
+            else:
+                _digest_stream(algorithm, file_, pbar)
     return algorithm.hexdigest()
 
 
-def lock_file(path):
+LOCK_BITS = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+UNLOCK_BITS = stat.S_IWUSR | stat.S_IWGRP
+EXEC_BITS = stat.S_IXUSR | stat.S_IXGRP
+
+
+def update_perms(path, set_bits=0, clear_bits=0, mode=None):
+    """set and clear permission bits, ignoring paths that do not exist
+
+    mode may be passed in when the caller has already stat'd the path.
+    """
+    try:
+        if mode is None:
+            mode = os.stat(path).st_mode
+        os.chmod(path, (stat.S_IMODE(mode) | set_bits) & ~clear_bits)
+    except OSError as ex:
+        if ex.errno != errno.ENOENT:
+            raise
+
+
+def lock_file(path, mode=None):
     """remove writable permissions"""
     # click.echo('Locking file: %s' % path)
-    if not os.path.exists(path):
-        return
-    mode = os.stat(path).st_mode
-    perms = stat.S_IMODE(mode)
-    mask = ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
-    os.chmod(path, perms & mask)
+    update_perms(path, clear_bits=LOCK_BITS, mode=mode)
 
 
-def unlock_file(path):
+def unlock_file(path, mode=None):
     """add writable permissions"""
-    if not os.path.exists(path):
-        return
-    mode = os.stat(path).st_mode
-    perms = stat.S_IMODE(mode)
-    os.chmod(path, perms | stat.S_IWUSR | stat.S_IWGRP)
+    update_perms(path, set_bits=UNLOCK_BITS, mode=mode)
 
 
-def make_executable(path):
+def make_executable(path, mode=None):
     """add executable permissions"""
-    if not os.path.exists(path):
+    update_perms(path, set_bits=EXEC_BITS, mode=mode)
+
+
+def ensure_dir(path):
+    """create path and any missing parents, tolerating existing ones"""
+    try:
+        os.makedirs(path)
+    except OSError as ex:
+        if ex.errno != errno.EEXIST:
+            raise
+
+
+class DirCache(object):
+    """Creates directories, remembering which ones are known to exist
+
+    Object and anchor directories are sharded by digest prefix, so most
+    entries land in a directory an earlier entry already created.
+    """
+
+    def __init__(self):
+        self.__known = set()
+
+    def ensure(self, path):
+        if path in self.__known:
+            return
+        ensure_dir(path)
+        self.__known.add(path)
+
+    def forget(self, root):
+        """drop knowledge of root and everything below it"""
+        prefix = os.path.join(root, '')
+        self.__known = set(path for path in self.__known
+                           if path != root and not path.startswith(prefix))
+
+
+def map_jobs(func, items, jobs):
+    """Call func on each item, spread over up to jobs threads"""
+    if jobs <= 1:
+        for item in items:
+            func(item)
         return
-    mode = os.stat(path).st_mode
-    perms = stat.S_IMODE(mode)
-    os.chmod(path, perms | stat.S_IXUSR | stat.S_IXGRP)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        # drain the results so the first exception propagates
+        for _ in pool.map(func, items):
+            pass
+
+
+def unique_digests(entries):
+    seen = set()
+    for entry in entries:
+        if entry.digest not in seen:
+            seen.add(entry.digest)
+            yield entry
+
+
+def walk_files(top, links=True):
+    """Yield every non-directory path below top
+
+    Like os.walk, symlinks to directories are neither followed nor yielded;
+    other symlinks are yielded only when links is true.
+    """
+    if not hasattr(os, 'scandir'):
+        for root, _, files in os.walk(top):
+            for file_ in files:
+                path = os.path.join(root, file_)
+                if links or not fs.islink(path):
+                    yield path
+        return
+    stack = [top]
+    while stack:
+        # list each directory fully before yielding, since callers replace
+        # files with symlinks as they go
+        files = []
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                # d_type answers is_dir() without a stat except for symlinks
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        stack.append(entry.path)
+                elif links or not entry.is_symlink():
+                    files.append(entry.path)
+        for file_ in files:
+            yield file_
 
 
 def rmtree_err_handler(function, path, excinfo):
@@ -349,71 +716,211 @@ def rmtree_err_handler(function, path, excinfo):
         function(path)
 
 
+def _stat_ns(st, name):
+    value = getattr(st, name + '_ns', None)
+    if value is None:
+        value = int(getattr(st, name) * 1000000000)
+    return value
+
+
+def stat_key(st):
+    return (st.st_dev, st.st_ino, st.st_size, _stat_ns(st, 'st_mtime'),
+            _stat_ns(st, 'st_ctime'))
+
+
+class DigestCache(object):
+    """Remembers file digests keyed by path and stat signature
+
+    Lets a file whose device, inode, size, mtime and ctime are unchanged skip
+    rehashing. Like git's index, entries for files modified no earlier than
+    the cache was written are treated as racy and ignored. Entries whose file
+    has since changed or disappeared are dropped the next time it is saved.
+    """
+
+    def __init__(self, path, root):
+        self.__cache = None
+        self.__saved_ns = 0
+        self.__dirty = False
+        self.path = path
+        self.root = root
+
+    @property
+    def cache(self):
+        if self.__cache is None:
+            self._load()
+        return self.__cache
+
+    def get(self, rel_path, st):
+        hit = self.cache.get(rel_path)
+        if not hit:
+            return None
+        key, digest = hit
+        if key != stat_key(st) or key[3] >= self.__saved_ns:
+            return None
+        return digest
+
+    def add(self, rel_path, st, digest):
+        self.cache[rel_path] = (stat_key(st), digest)
+        self.__dirty = True
+
+    def save(self):
+        if not self.__dirty:
+            return
+        ensure_dir(os.path.dirname(self.path))
+        with atomic_open(self.path, 'wb') as file_:
+            for rel_path, (key, digest) in self.__cache.items():
+                if '\n' in rel_path or not self._is_current(rel_path, key):
+                    continue
+                fields = list(map(str, key)) + [digest, rel_path]
+                file_.write('{}\n'.format(' '.join(fields)).encode('utf-8'))
+        self.__dirty = False
+
+    def _is_current(self, rel_path, key):
+        try:
+            st = os.lstat(os.path.join(self.root, rel_path))
+        except OSError:
+            return False
+        return stat_key(st) == key
+
+    def _load(self):
+        self.__cache = dict()
+        if os.path.exists(self.path):
+            self.__saved_ns = _stat_ns(os.stat(self.path), 'st_mtime')
+            with io.open(self.path, 'r', encoding='utf-8') as file_:
+                for line in file_:
+                    fields = line.rstrip('\n').split(' ', 6)
+                    if len(fields) == 7:
+                        key = tuple(int(x) for x in fields[:5])
+                        self.__cache[fields[6]] = (key, fields[5])
+
+
 class DepotIndex(object):
+    """Records the digests (and sizes) known to be in the depot
+
+    The file is an append-only log of 'digest size' lines where later lines
+    win; it is compacted on load once it holds mostly superseded lines or ends
+    in a torn append. New entries are held in memory until flush() appends
+    them in one write.
+    """
+
     def __init__(self, path):
-        self.__index = dict()
+        self.__index = None
+        self.__pending = []
         self.path = path
 
     @property
     def index(self):
-        self._load()
+        # loaded once; git-big holds a global lock so nobody else writes it
+        if self.__index is None:
+            self._load()
         return self.__index
 
     def has_digest(self, digest):
         return self.index.get(digest)
 
     def add_digest(self, digest, size):
+        if self.index.get(digest) == size:
+            return
         self.index[digest] = size
-        self._save()
+        self.__pending.append('{} {}\n'.format(digest, size))
+
+    def flush(self):
+        if not self.__pending:
+            return
+        ensure_dir(os.path.dirname(self.path))
+        with io.open(self.path, 'ab') as file_:
+            file_.write(''.join(self.__pending).encode())
+        self.__pending = []
 
     def _load(self):
         self.__index = dict()
-        if os.path.exists(self.path):
-            with io.open(self.path, 'r', encoding='utf-8') as file_:
-                for line in file_:
-                    pair = line.rstrip().split(' ', 2)
-                    if len(pair) == 2:
-                        self.__index[pair[0]] = int(pair[1])
-
-    def _save(self):
-        dir_path = os.path.dirname(self.path)
-        if not os.path.exists(dir_path):
-            os.makedirs(dir_path)
+        if not os.path.exists(self.path):
+            return
+        with io.open(self.path, 'rb') as file_:
+            lines = file_.read().decode('utf-8').split('\n')
+        # what follows the last newline is either nothing or what's left of
+        # an interrupted append, which the next append must not run into
+        torn = lines.pop()
+        for line in lines:
+            pair = line.split(' ', 2)
+            if len(pair) == 2:
+                self.__index[pair[0]] = int(pair[1])
+        if torn or len(lines) > 2 * len(self.__index):
+            self._compact()
+
+    def _compact(self):
         with atomic_open(self.path, 'wb') as file_:
             for digest, size in self.__index.items():
                 file_.write('{} {}\n'.format(digest, size).encode())
 
 
 class Depot(object):
-    def __init__(self, config, repo):
+    def __init__(self, config, repo, dirs):
         self.config = config.depot
         self.repo = repo
+        self.dirs = dirs
         self.__storage = git_big.storage.get_driver(self.config)
-        if not os.path.exists(config.cache_dir):
-            os.makedirs(config.cache_dir)
-        self.index = DepotIndex(os.path.join(config.cache_dir, 'index'))
+        # one index and listing marker per depot, since repos using different
+        # depots may share a cache; the key is part of the depot's identity
+        # because the local driver keeps its root directory there
+        depot_id = hashlib.sha1('{} {}'.format(
+            self.config.url, self.config.key or '').encode('utf-8')).hexdigest()
+        self.index = DepotIndex(
+            os.path.join(config.cache_dir, 'indexes', depot_id))
+        self.listed_path = os.path.join(config.cache_dir, 'listed', depot_id)
         self.refs_path = self.config.make_path('refs', config.uuid)
         self.tmp_dir = os.path.join(config.cache_dir, 'tmp')
-        if not os.path.exists(self.tmp_dir):
-            os.makedirs(self.tmp_dir)
+        self.dirs.ensure(self.tmp_dir)
+        self.__listed = False
+
+    def warm_index(self):
+        """Learn every object in the depot from one paginated listing"""
+        prefix = self.config.make_path('objects', '')
+        for obj_path, size in self.__storage.list_objects(prefix):
+            self.index.add_digest(obj_path[len(prefix):], size)
+        self.dirs.ensure(os.path.dirname(self.listed_path))
+        with io.open(self.listed_path, 'ab'):
+            os.utime(self.listed_path, None)
+
+    def _listed_recently(self):
+        try:
+            age = time.time() - os.stat(self.listed_path).st_mtime
+        except OSError:
+            return False
+        return 0 <= age < INDEX_TTL
+
+    def prepare(self, entries):
+        """Choose how to look up the entries that are about to be queried
+
+        Lists the whole depot when many of them are missing from the index,
+        unless a recent command already did; anything else is probed one
+        object at a time.
+        """
+        unknown = sum(1 for x in entries
+                      if self.index.has_digest(x.digest) is None)
+        self.__listed = (unknown >= LIST_THRESHOLD
+                         and not self._listed_recently())
+        if self.__listed:
+            self.warm_index()
 
     def _entry(self, entry):
         # use an index to prevent having to query the depot when we know
         # for certain that the object exists in the bucket
         size = self.index.has_digest(entry.digest)
+        if size is None and not self.__listed:
+            size = self.__storage.has_object(entry.depot_path)
+            if size is not None:
+                self.index.add_digest(entry.digest, size)
         if size is not None:
             entry._depot_size = size
-            return
-
-        size = self.__storage.has_object(entry.depot_path)
-        if size is not None:
-            entry._depot_size = size
-            self.index.add_digest(entry.digest, size)
 
     def get_status(self, entry):
         self._entry(entry)
 
-    def get(self, entry):
+    def flush(self):
+        self.index.flush()
+
+    def get(self, entry, progress=True):
         self._entry(entry)
         if not entry.in_depot:
             click.echo('Object missing from depot: %s' % entry.digest)
@@ -422,23 +929,32 @@ class Depot(object):
         tmp_file, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
         os.close(tmp_file)
         try:
-            self.__storage.get_file(entry.depot_path, tmp_path)
+            try:
+                self.__storage.get_file(entry.depot_path, tmp_path, progress)
+            except IOError as ex:
+                raise click.ClickException(
+                    'Download failed: %s (%s)' % (entry.digest, ex))
+            digest = compute_digest(tmp_path)
+            if digest != entry.digest:
+                raise click.ClickException(
+                    'Corrupt object in depot: %s (downloaded %s)' %
+                    (entry.digest, digest))
             # Finalize and rename
-            cache_dir = os.path.dirname(entry.cache_path)
-            if not os.path.exists(cache_dir):
-                os.makedirs(cache_dir)
+            self.dirs.ensure(os.path.dirname(entry.cache_path))
             os.rename(tmp_path, entry.cache_path)
         finally:
             if os.path.exists(tmp_path):
                 os.unlink(tmp_path)
         # Lock and add to cache
         lock_file(entry.cache_path)
+        entry.invalidate()
         self.index.add_digest(entry.digest, entry._depot_size)
 
-    def put(self, entry):
+    def put(self, entry, progress=True):
         self._entry(entry)
         if not entry.in_depot:
-            self.__storage.put_file(entry.depot_path, entry.cache_path)
+            self.__storage.put_file(entry.depot_path, entry.cache_path,
+                                    progress)
             self.index.add_digest(entry.digest,
                                   os.path.getsize(entry.cache_path))
 
@@ -457,8 +973,7 @@ class Depot(object):
             'user': getpass.getuser(),
             'path': self.repo.git_dir,
         }
-        buf = '\n'.join(refs)
-        self.__storage.put_string(self.refs_path, buf, metadata)
+        self.__storage.put_lines(self.refs_path, refs, metadata)
 
     def delete_refs(self):
         self.__storage.delete_object(self.refs_path)
@@ -467,38 +982,51 @@ class Depot(object):
 class App(object):
     def __init__(self):
         self.repo = GitRepository()
+        self.cwd = os.getcwd()
 
         # Load user configuration, creating anew if none exists
         self.user_config_path = os.path.expanduser(
             os.path.join('~', '.gitbig'))
+        # remember what is on disk so unchanged configs aren't rewritten
         if os.path.exists(self.user_config_path):
-            with io.open(
-                    self.user_config_path, 'r', encoding='utf-8') as file_:
-                self.user_config = UserConfig(**json.load(file_))
+            self.user_config = UserConfig(**load_json(self.user_config_path))
+            self.saved_user_config = dict(self.user_config)
         else:
             self.user_config = UserConfig()
+            self.saved_user_config = None
 
         # Load repo configuration, creating anew if none exists
         self.repo_config_path = os.path.join(self.repo.working_dir, '.gitbig')
         if os.path.exists(self.repo_config_path):
-            with io.open(
-                    self.repo_config_path, 'r', encoding='utf-8') as file_:
-                self.repo_config = self._load_config(file_)
+            self.repo_config = self._load_config(self.repo_config_path)
+            self.saved_files = dict(self.repo_config.files)
         else:
             self.repo_config = RepoConfig()
+            self.saved_files = None
 
         # Load git configuration
         self.git_config = GitConfig()
 
+        self.digests = DigestCache(
+            os.path.join(self.repo.git_dir, 'git-big', 'stat-cache'),
+            self.repo.working_dir)
+
         # Combined view of overall configuration
         self.config = Config(self.repo_config, self.git_config,
                              self.user_config, self.repo.working_dir)
 
+        self.dirs = DirCache()
+
         if self.config.depot:
-            self.depot = Depot(self.config, self.repo)
+            self.depot = Depot(self.config, self.repo, self.dirs)
         else:
             self.depot = None
 
+    def _flush_depot(self):
+        # the depot index batches what it learns; persist it once per command
+        if self.depot:
+            self.depot.flush()
+
     def _check_depot(self, present_participle):
         if not self.depot:
             raise click.ClickException(
@@ -516,7 +1044,10 @@ class App(object):
         self._call_hook_chain('pre-push', remote, url)
 
     def cmd_hooks_post_checkout(self, previous, new, flag):
-        self.cmd_pull()
+        # switching branches without moving HEAD (e.g. checkout -b) leaves
+        # the tree, and so every link, as it was
+        if flag != '1' or previous != new:
+            self.cmd_pull()
         self._call_hook_chain('post-checkout', previous, new, flag)
 
     def cmd_hooks_post_merge(self, flag):
@@ -530,30 +1061,49 @@ class App(object):
         click.echo('    Cache')
         click.echo('      Depot')
         click.echo('          SHA-256    Size Path')
-        for entry in self._entries():
+        entries = list(self._entries())
+        try:
             if self.depot:
-                self.depot.get_status(entry)
-            if entry.is_linked:
-                w_bit = 'W'
-            elif entry.in_working:
-                w_bit = '*'
-            else:
-                w_bit = ' '
-            c_bit = entry.in_cache and 'C' or ' '
-            d_bit = entry.in_depot and 'D' or ' '
-            click.echo('[ {} {} {} ] {} {:>6} {}'.format(
-                w_bit, c_bit, d_bit, entry.digest[:8], human_size(entry.size),
-                entry.rel_path))
+                self.depot.prepare(list(unique_digests(entries)))
+            for entry in entries:
+                if self.depot:
+                    self.depot.get_status(entry)
+                if entry.is_linked:
+                    w_bit = 'W'
+                elif entry.in_working:
+                    w_bit = '*'
+                else:
+                    w_bit = ' '
+                c_bit = entry.in_cache and 'C' or ' '
+                d_bit = entry.in_depot and 'D' or ' '
+                click.echo('[ {} {} {} ] {} {:>6} {}'.format(
+                    w_bit, c_bit, d_bit, entry.digest[:8],
+                    human_size(entry.size), entry.rel_path))
+        finally:
+            self._flush_depot()
         click.echo()
 
-    def cmd_add(self, paths):
-        for path in self._walk(paths):
-            self._add_file(path)
+    def cmd_add(self, paths, jobs=1):
+        if not jobs:
+            jobs = multiprocessing.cpu_count()
+        # symlinks are files that have already been added; overlapping
+        # arguments (e.g. "dir dir/foo") must not add a file twice, since a
+        # worker could hash it after it has been moved into the cache
+        paths = self._unique(self._walk(paths, links=False))
+        added = []
+        for path, st, digest in self._digest_files(paths, jobs):
+            added.append(self._add_file(path, st, digest))
+        # stage everything together rather than running git once per file
+        self.repo.index.add(added)
         self._save_config()
 
     def cmd_remove(self, paths):
+        removed = []
         for path in self._walk(paths):
-            self._remove_file(path)
+            working_path = self._remove_file(path)
+            if working_path:
+                removed.append(working_path)
+        self.repo.index.remove(removed)
         self._save_config()
 
     def cmd_unlock(self, paths):
@@ -572,13 +1122,26 @@ class App(object):
             self._move_file(src, tgt)
         self._save_config()
 
-    def cmd_push(self):
+    def cmd_push(self, jobs=1):
         self._check_depot('pushing')
-        for entry in self._entries():
-            self.depot.put(entry)
+        # progress bars from concurrent transfers would interleave
+        progress = jobs <= 1
+        entries = list(unique_digests(self._entries()))
+        try:
+            self.depot.prepare(entries)
+            map_jobs(lambda entry: self.depot.put(entry, progress), entries,
+                     jobs)
+        finally:
+            self._flush_depot()
         self.depot.save_refs(self._find_reachable_objects())
 
-    def cmd_pull(self, paths=[], soft=True, extra=None):
+    def cmd_pull(self, paths=[], soft=True, extra=None, jobs=1):
+        try:
+            self._pull(paths, soft, extra, jobs)
+        finally:
+            self._flush_depot()
+
+    def _pull(self, paths, soft, extra, jobs):
         if paths:
             soft = False
         if not soft:
@@ -591,25 +1154,28 @@ class App(object):
         # clear the anchors on each full pull
         if os.path.exists(self.config.anchors_dir) and not paths:
             shutil.rmtree(self.config.anchors_dir, onerror=rmtree_err_handler)
+            self.dirs.forget(self.config.anchors_dir)
+        # grab a copy of anything missing from the cache if it's in the depot
+        if self.depot and not soft:
+            progress = jobs <= 1
+            missing = [x for x in unique_digests(entries) if not x.in_cache]
+            self.depot.prepare(missing)
+            map_jobs(lambda entry: self.depot.get(entry, progress), missing,
+                     jobs)
         # now go thru the index and populate all the anchors
         for entry in entries:
-            # grab a copy from the depot if it exists
-            if not entry.in_cache and self.depot and not soft:
-                self.depot.get(entry)
             if entry.in_cache:
                 # add hardlink from the anchor to the cache
                 if not entry.in_anchors:
                     anchor_dir = os.path.dirname(entry.anchor_path)
-                    if not os.path.exists(anchor_dir):
-                        os.makedirs(anchor_dir)
-                    fs.link(entry.cache_path, entry.anchor_path)
+                    self.dirs.ensure(anchor_dir)
+                    link_or_copy(entry.cache_path, entry.anchor_path)
                 # add a symlink from the working path to the anchor
                 if not entry.in_working:
                     click.echo('Linking: %s -> %s' % (entry.digest[:8],
                                                       entry.rel_path))
                     entry_dir = os.path.dirname(entry.working_path)
-                    if not os.path.exists(entry_dir):
-                        os.makedirs(entry_dir)
+                    self.dirs.ensure(entry_dir)
                     fs.symlink(entry.symlink_path, entry.working_path)
                 elif not entry.is_link:
                     click.echo('Pull aborted, dirty file detected: "%s"' %
@@ -628,9 +1194,8 @@ class App(object):
                     click.echo(
                         'Linking: %s -> %s' % (entry.digest[:8], extra_path))
                     extra_dir = os.path.dirname(extra_path)
-                    if not os.path.exists(extra_dir):
-                        os.makedirs(extra_dir)
-                    fs.link(entry.cache_path, extra_path)
+                    self.dirs.ensure(extra_dir)
+                    link_or_copy(entry.cache_path, extra_path)
             else:
                 click.echo(
                     'File "{}" not available locally; use `git big pull --hard` to download it'.
@@ -661,14 +1226,11 @@ class App(object):
                     click.echo('  Hash: %s' % digest)
 
     def cmd_custom_merge(self, ancestor_path, current_path, other_path):  # pylint: disable=W0613
-        with io.open(current_path, 'r', encoding='utf-8') as file_:
-            current = self._load_config(file_)
-        with io.open(other_path, 'r', encoding='utf-8') as file_:
-            other = self._load_config(file_)
+        current = self._load_config(current_path)
+        other = self._load_config(other_path)
         current.merge(other)
         with atomic_open(current_path, 'wb') as file_:
-            file_.write(json.dumps(dict(current), indent=4).encode())
-            file_.write('\n'.encode())
+            file_.write(dump_json(dict(current)))
 
     def _find_reachable_objects(self):
         reachable = set()
@@ -678,52 +1240,53 @@ class App(object):
             parts = line.split()
             if len(parts) > 1 and parts[1] == '.gitbig':
                 objects.add(parts[0])
-        for obj in objects:
-            raw_index = git('show', obj)
-            index = RepoConfig(**json.loads(raw_index))
-            for digest in six.itervalues(index.files):
-                reachable.add(digest)
+        for _, raw_index in git_cat_file(objects):
+            index = RepoConfig(**json_loads(raw_index))
+            reachable.update(six.itervalues(index.files))
         return reachable
 
-    def _load_config(self, file_):
-        return RepoConfig(**json.load(file_))
+    def _load_config(self, path):
+        return RepoConfig(**load_json(path))
 
     def _save_config(self):
         self.git_config.save()
+        self.digests.save()
 
-        with atomic_open(self.user_config_path, 'wb') as file_:
-            file_.write(json.dumps(dict(self.user_config), indent=4).encode())
-            file_.write('\n'.encode())
+        user_config = dict(self.user_config)
+        if user_config != self.saved_user_config:
+            with atomic_open(self.user_config_path, 'wb') as file_:
+                file_.write(dump_json(user_config))
+            self.saved_user_config = user_config
 
         if self.repo_config.files:
-            with atomic_open(self.repo_config_path, 'wb') as file_:
-                file_.write(
-                    json.dumps(dict(self.repo_config), indent=4).encode())
-                file_.write('\n'.encode())
-            self.repo.index.add([self.repo_config_path])
+            # skip both the rewrite and the git add when nothing changed
+            if self.repo_config.files != self.saved_files:
+                with atomic_open(self.repo_config_path, 'wb') as file_:
+                    file_.write(dump_json(dict(self.repo_config)))
+                self.repo.index.add([self.repo_config_path])
+                self.saved_files = dict(self.repo_config.files)
         else:
             if os.path.exists(self.repo_config_path):
                 os.unlink(self.repo_config_path)
                 self.repo.index.remove([self.repo_config_path])
+            self.saved_files = None
 
         exclude_path = os.path.join(self.repo.git_dir, 'info', 'exclude')
         self._ensure_line(exclude_path, '/.gitbig-anchors')
 
     def _ensure_line(self, path, to_add):
-        changed = False
-        lines = []
+        content = ''
         if os.path.exists(path):
             with io.open(path, 'r', encoding='utf-8') as file_:
-                for line in file_:
-                    lines.append(line.rstrip())
-        if to_add not in lines:
-            lines.append(to_add)
-            changed = True
+                content = file_.read()
+        lines = set(line.rstrip() for line in content.splitlines())
+        if to_add in lines:
+            return False
+        if content and not content.endswith('\n'):
+            content += '\n'
         with atomic_open(path, 'wb') as file_:
-            for line in lines:
-                file_.write(line.encode())
-                file_.write('\n'.encode())
-        return changed
+            file_.write((content + to_add + '\n').encode('utf-8'))
+        return True
 
     def _install_hooks(self):
         self._install_hook('pre-push', 2)
@@ -766,85 +1329,121 @@ class App(object):
             if not paths or rel_path in paths:
                 yield Entry(self.config, rel_path, digest)
 
-    def _walk(self, paths):
+    def _walk(self, paths, links=True):
         for path in paths:
             if os.path.isdir(path):
-                for root, _, files in os.walk(path):
-                    for file_ in files:
-                        yield os.path.join(root, file_)
-            else:
+                for file_ in walk_files(path, links):
+                    yield file_
+            elif links or not fs.islink(path):
                 yield path
 
-    def _add_file(self, path):
-        if fs.islink(path):
+    def _unique(self, paths):
+        seen = set()
+        unique = []
+        for path in paths:
+            key = os.path.normpath(os.path.join(self.cwd, path))
+            if key not in seen:
+                seen.add(key)
+                unique.append(path)
+        return unique
+
+    def _rel_path(self, path):
+        # joining against the cached cwd keeps relpath from calling getcwd
+        # for every file in a large add/rm
+        return os.path.relpath(
+            os.path.join(self.cwd, path), self.repo.working_dir)
+
+    def _digest_files(self, paths, jobs):
+        """Yield (path, stat, digest) for each path, in order"""
+        stats = [os.stat(x) for x in paths]
+        cached = [
+            self.digests.get(self._rel_path(x), st)
+            for x, st in zip(paths, stats)
+        ]
+        if jobs <= 1:
+            for path, st, digest in zip(paths, stats, cached):
+                if not digest:
+                    digest = compute_digest(path, self._rel_path(path))
+                yield path, st, digest
             return
 
-        rel_path = os.path.relpath(
-            os.path.abspath(path), self.repo.working_dir)
-        digest = compute_digest(path, rel_path)
+        # hashlib drops the GIL while hashing, so threads scale with cores;
+        # progress bars from several threads would interleave, so skip them
+        def digest_one(path, digest):
+            return digest or compute_digest(path)
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            digests = pool.map(digest_one, paths, cached)
+            for path, st, digest in zip(paths, stats, digests):
+                yield path, st, digest
+
+    def _add_file(self, path, st, digest):
+        rel_path = self._rel_path(path)
         entry = Entry(self.config, rel_path, digest)
 
         if not entry.in_cache:
             cache_dir = os.path.dirname(entry.cache_path)
-            if not os.path.exists(cache_dir):
-                os.makedirs(cache_dir)
-            os.rename(entry.working_path, entry.cache_path)
-            lock_file(entry.cache_path)
+            self.dirs.ensure(cache_dir)
+            move_file(entry.working_path, entry.cache_path)
+            lock_file(entry.cache_path, st.st_mode)
         else:
             os.unlink(entry.working_path)
 
         if not entry.in_anchors:
             anchor_dir = os.path.dirname(entry.anchor_path)
-            if not os.path.exists(anchor_dir):
-                os.makedirs(anchor_dir)
-            fs.link(entry.cache_path, entry.anchor_path)
+            self.dirs.ensure(anchor_dir)
+            link_or_copy(entry.cache_path, entry.anchor_path)
 
         fs.symlink(entry.symlink_path, entry.working_path)
-        self.repo.index.add([entry.working_path])
 
         self.repo_config.files[rel_path] = digest
+        return entry.working_path
 
     def _remove_file(self, path):
-        rel_path = os.path.relpath(
-            os.path.abspath(path), self.repo.working_dir)
+        rel_path = self._rel_path(path)
         if os.path.exists(path):
             os.unlink(path)
         digest = self.repo_config.files.get(rel_path)
         if not digest:
-            return
+            return None
         entry = Entry(self.config, rel_path, digest)
-        self.repo.index.remove([entry.working_path])
         click.echo(rel_path)
         del self.repo_config.files[rel_path]
+        return entry.working_path
 
     def _copy_via_chunk(self, src, dst):
-        size = os.path.getsize(src)
-        rel_path = os.path.relpath(os.path.abspath(dst), self.repo.working_dir)
-        with io.open(src, 'rb') as src_file_, atomic_open(dst,
-                                                          'wb') as dst_file_:
-            with make_progress_bar(rel_path, size) as pbar:
-                copied = 0
-                while True:
-                    buf = src_file_.read(BLOCKSIZE)
-                    if not buf:
-                        break
-                    dst_file_.write(buf)
-                    copied += len(buf)
-                    pbar.update(copied)
+        """Copy src over dst, returning the st_mode given to dst"""
+        rel_path = self._rel_path(dst)
+        # stage the copy next to dst so the final rename never crosses devices
+        tmp_file, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dst))
+        try:
+            with io.open(src, 'rb') as src_file_, \
+                    io.open(tmp_file, 'wb') as dst_file_:
+                st = os.fstat(src_file_.fileno())
+                with make_progress_bar(rel_path, st.st_size) as pbar:
+                    copy_file_data(src_file_, dst_file_, st.st_size,
+                                   pbar.update)
+            shutil.copystat(src, tmp_path)
+            replace_file(tmp_path, dst)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        return st.st_mode
 
     def _unlock_file(self, path):
         if not fs.islink(path):
             return
-        rel_path = os.path.relpath(
-            os.path.abspath(path), self.repo.working_dir)
+        rel_path = self._rel_path(path)
         digest = self.repo_config.files.get(rel_path)
         if not digest:
             return
         entry = Entry(self.config, rel_path, digest)
         os.unlink(entry.working_path)
         self.repo.index.remove([entry.working_path])
-        self._copy_via_chunk(entry.cache_path, entry.working_path)
-        unlock_file(entry.working_path)
+        mode = self._copy_via_chunk(entry.cache_path, entry.working_path)
+        unlock_file(entry.working_path, mode)
+        # the copy is known to match the digest until it is modified
+        self.digests.add(rel_path, os.stat(entry.working_path), digest)
         del self.repo_config.files[rel_path]
 
     def _get_src_tgt_pairs(self, srcs, tgt):
@@ -863,12 +1462,12 @@ class App(object):
                 yield (srcs[0], tgt)
 
     def _copy_file(self, src, tgt):
-        rel_tgt = os.path.relpath(os.path.abspath(tgt), self.repo.working_dir)
+        rel_tgt = self._rel_path(tgt)
         if rel_tgt.startswith('..') or rel_tgt.startswith('/'):
             click.echo('Destination must be inside repository: %s' % tgt)
             return
 
-        rel_src = os.path.relpath(os.path.abspath(src), self.repo.working_dir)
+        rel_src = self._rel_path(src)
         digest = self.repo_config.files.get(rel_src)
         if not digest:
             click.echo('Source not in index: %s' % src)
@@ -879,13 +1478,12 @@ class App(object):
         self.repo_config.files[rel_tgt] = digest
 
     def _move_file(self, src, tgt):
-        rel_src = os.path.relpath(os.path.abspath(src), self.repo.working_dir)
-        rel_tgt = os.path.relpath(os.path.abspath(tgt), self.repo.working_dir)
+        rel_src = self._rel_path(src)
+        rel_tgt = self._rel_path(tgt)
         if rel_tgt.startswith('..') or rel_tgt.startswith('/'):
             click.echo('Destination must be inside repository: %s' % tgt)
             return
 
-        rel_src = os.path.relpath(os.path.abspath(src), self.repo.working_dir)
         digest = self.repo_config.files.get(rel_src)
         if not digest:
             click.echo('Source not in index: %s' % src)
@@ -964,14 +1562,20 @@ def cmd_status():
 
 
 @cli.command('add')
+@click.option(
+    '-j',
+    '--jobs',
+    default=1,
+    type=click.IntRange(0, None),
+    help='Number of files to hash in parallel; 0 uses one per CPU.')
 @click.argument('paths', nargs=-1, type=click.Path(exists=True))
-def cmd_add(paths):
+def cmd_add(jobs, paths):
     """Add big files.
 
     Each specified path will be added to git-big.
     If a path refers to a directory, all files within the directory will be recursively added to the index.
     """
-    App().cmd_add(paths)
+    App().cmd_add(paths, jobs=jobs)
 
 
 @cli.command('rm')
@@ -1023,24 +1627,36 @@ def cmd_copy(sources, dest):
 
 
 @cli.command('push')
-def cmd_push():
+@click.option(
+    '-j',
+    '--jobs',
+    default=1,
+    type=click.IntRange(1, None),
+    help='Number of files to upload in parallel.')
+def cmd_push(jobs):
     """Push big files.
 
     Uploads big files to any configured depot.
     """
-    App().cmd_push()
+    App().cmd_push(jobs=jobs)
 
 
 @cli.command('pull')
 @click.argument('paths', nargs=-1, type=click.Path())
 @click.option('--soft/--hard', default=True)
 @click.option('--extra', type=click.Path(writable=True, resolve_path=True))
-def cmd_pull(paths, soft, extra):
+@click.option(
+    '-j',
+    '--jobs',
+    default=1,
+    type=click.IntRange(1, None),
+    help='Number of files to download in parallel.')
+def cmd_pull(paths, soft, extra, jobs):
     """Pull big files.
 
     Downloads big files from any configured depot.
     """
-    App().cmd_pull(paths=paths, soft=soft, extra=extra)
+    App().cmd_pull(paths=paths, soft=soft, extra=extra, jobs=jobs)
 
 
 @cli.command('drop')
@@ -1135,8 +1751,7 @@ def main():
                 'git-big requires symlinks to be enabled; run `git big windows-setup`'
             )
             sys.exit(1)
-    if not os.path.exists(DEFAULT_CACHE_DIR):
-        os.makedirs(DEFAULT_CACHE_DIR)
+    ensure_dir(DEFAULT_CACHE_DIR)
     lock_path = os.path.join(DEFAULT_CACHE_DIR, 'lock')
     with Singlet(lock_path):
         cli()
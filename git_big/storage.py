@@ -15,6 +15,7 @@
 from __future__ import print_function
 
 import os
+import threading
 
 import boto3
 import botocore
@@ -25,10 +26,12 @@ from six import BytesIO
 
 from six.moves.urllib.parse import urlparse
 
-CHUNK_SIZE = 1024 * 1024
+CHUNK_SIZE = 8 * 1024 * 1024
 
 
-def make_progress_bar(name, size):
+def make_progress_bar(name, size, progress=True):
+    if not progress:
+        return progressbar.NullBar(max_value=size)
     widgets = [
         '%s: ' % name[:8],
         progressbar.Percentage(),
@@ -44,6 +47,52 @@ def make_progress_bar(name, size):
     return progressbar.ProgressBar(widgets=widgets, max_value=size)
 
 
+def iter_lines(lines, chunk_size=CHUNK_SIZE):
+    """Yield newline-joined, encoded lines in chunks of roughly chunk_size
+
+    The chunks always add up to exactly b'\\n'.join(lines), however they split.
+    """
+    buf = []
+    buf_len = 0
+    first = True
+    for line in lines:
+        if not first:
+            buf.append(b'\n')
+            buf_len += 1
+        first = False
+        data = line.encode()
+        buf.append(data)
+        buf_len += len(data)
+        if buf_len >= chunk_size:
+            yield b''.join(buf)
+            buf = []
+            buf_len = 0
+    if buf or first:
+        yield b''.join(buf)
+
+
+def iter_file(file_, pbar, chunk_size=CHUNK_SIZE):
+    """Yield chunks of an open file, advancing pbar as each one is consumed"""
+    total_len = 0
+    while True:
+        chunk = file_.read(chunk_size)
+        if not chunk:
+            break
+        total_len += len(chunk)
+        pbar.update(total_len)
+        yield chunk
+
+
+def preallocate(file_, size):
+    """Reserve size bytes for file_ up front so it can be laid out contiguously"""
+    if size and hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(file_.fileno(), 0, size)
+        except OSError:
+            # not supported by this filesystem; it will just grow as written
+            pass
+
+
 class Storage(object):
     def __init__(self, config):
         pass
@@ -51,13 +100,16 @@ class Storage(object):
     def has_object(self, obj_path):
         raise NotImplementedError()
 
+    def list_objects(self, prefix):
+        raise NotImplementedError()
+
     def delete_object(self, obj_path):
         raise NotImplementedError()
 
-    def get_file(self, obj_path, file_path):
+    def get_file(self, obj_path, file_path, progress=True):
         raise NotImplementedError()
 
-    def put_file(self, obj_path, file_path):
+    def put_file(self, obj_path, file_path, progress=True):
         raise NotImplementedError()
 
     def get_string(self, obj_path):
@@ -66,6 +118,9 @@ class Storage(object):
     def put_string(self, obj_path, data, metadata={}):
         raise NotImplementedError()
 
+    def put_lines(self, obj_path, lines, metadata={}):
+        raise NotImplementedError()
+
 
 class StorageObject(object):
     def __init__(self, data, metadata, last_modified):
@@ -77,19 +132,22 @@ class StorageObject(object):
 class LibcloudStorage(Storage):
     def __init__(self, config):
         self.__config = config
-        self.__bucket = None
+        # libcloud drivers hold one connection each, so give every thread
+        # its own
+        self.__local = threading.local()
 
     def __connect(self):
         parts = urlparse(self.__config.url)
         driver = libcloud.get_driver(libcloud.DriverType.STORAGE, parts.scheme)
         service = driver(self.__config.key, self.__config.secret)
-        self.__bucket = service.get_container(parts.hostname)
+        return service.get_container(parts.hostname)
 
     @property
     def bucket(self):
-        if not self.__bucket:
-            self.__connect()
-        return self.__bucket
+        bucket = getattr(self.__local, 'bucket', None)
+        if bucket is None:
+            bucket = self.__local.bucket = self.__connect()
+        return bucket
 
     def has_object(self, obj_path):
         try:
@@ -98,6 +156,12 @@ class LibcloudStorage(Storage):
         except ObjectDoesNotExistError:
             return None
 
+    def list_objects(self, prefix):
+        # older libcloud drivers can't filter by prefix server-side
+        for obj in self.bucket.iterate_objects():
+            if obj.name.startswith(prefix):
+                yield obj.name, obj.size
+
     def delete_object(self, obj_path):
         try:
             obj = self.bucket.get_object(obj_path)
@@ -105,24 +169,32 @@ class LibcloudStorage(Storage):
             return
         self.bucket.delete_object(obj)
 
-    def get_file(self, obj_path, file_path):
+    def get_file(self, obj_path, file_path, progress=True):
         obj = self.bucket.get_object(obj_path)
         filename = os.path.basename(obj_path)
-        with make_progress_bar(filename, obj.size) as pbar:
+        with make_progress_bar(filename, obj.size, progress) as pbar:
             stream = self.bucket.download_object_as_stream(
                 obj, chunk_size=CHUNK_SIZE)
-            with open(file_path, 'wb') as file_:
+            with open(file_path, 'wb', CHUNK_SIZE) as file_:
+                preallocate(file_, obj.size)
                 total_len = 0
                 for chunk in stream:
                     file_.write(chunk)
                     total_len += len(chunk)
                     pbar.update(total_len)
+                # an early end of stream would leave the preallocated tail
+                # zero-filled rather than short
+                if total_len != obj.size:
+                    raise IOError('Incomplete download of %s: %d of %d bytes' %
+                                  (obj_path, total_len, obj.size))
 
-    def put_file(self, obj_path, file_path):
+    def put_file(self, obj_path, file_path, progress=True):
         filename = os.path.basename(file_path)
         file_size = os.path.getsize(file_path)
-        with make_progress_bar(filename, file_size) as pbar:
-            self.bucket.upload_object(file_path, obj_path)
+        with make_progress_bar(filename, file_size, progress) as pbar:
+            with open(file_path, 'rb') as file_:
+                self.bucket.upload_object_via_stream(
+                    iter_file(file_, pbar), obj_path)
 
     def get_string(self, obj_path):
         try:
@@ -142,6 +214,11 @@ class LibcloudStorage(Storage):
         stream = BytesIO(data.encode())
         self.bucket.upload_object_via_stream(stream, obj_path, extra=extra)
 
+    def put_lines(self, obj_path, lines, metadata={}):
+        extra = {'meta_data': metadata}
+        self.bucket.upload_object_via_stream(
+            iter_lines(lines), obj_path, extra=extra)
+
 
 class BotoProgress(object):
     def __init__(self, pbar):
@@ -160,23 +237,31 @@ class BotoStorage(Storage):
             aws_secret_access_key=config.secret,
         )
         parts = urlparse(config.url)
-        bucket_name = parts.hostname
+        self.__bucket_name = parts.hostname
         if parts.scheme == 'gs':
-            s3 = session.resource(
-                's3',
+            self.__resource_args = dict(
                 endpoint_url='https://storage.googleapis.com',
                 config=botocore.client.Config(signature_version='s3v4'))
         elif parts.scheme == 's3+http':
-            s3 = session.resource(
-                's3', endpoint_url='http://{}'.format(parts.netloc))
-            bucket_name = parts.path[1:]  # skip leading '/'
+            self.__resource_args = dict(
+                endpoint_url='http://{}'.format(parts.netloc))
+            self.__bucket_name = parts.path[1:]  # skip leading '/'
         else:
-            s3 = session.resource('s3')
-        self.__bucket = s3.Bucket(bucket_name)
+            self.__resource_args = dict()
+        # boto3 resources aren't thread-safe and neither is creating them
+        # from a shared session, so build one per thread under a lock
+        self.__session = session
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
 
     @property
     def bucket(self):
-        return self.__bucket
+        bucket = getattr(self.__local, 'bucket', None)
+        if bucket is None:
+            with self.__lock:
+                s3 = self.__session.resource('s3', **self.__resource_args)
+            bucket = self.__local.bucket = s3.Bucket(self.__bucket_name)
+        return bucket
 
     def has_object(self, obj_path):
         try:
@@ -187,19 +272,24 @@ class BotoStorage(Storage):
                 return None
             raise
 
+    def list_objects(self, prefix):
+        for obj in self.bucket.objects.filter(Prefix=prefix):
+            yield obj.key, obj.size
+
     def delete_object(self, obj_path):
         self.bucket.delete_objects(Delete={'Objects': [{'Key': obj_path}]})
 
-    def get_file(self, obj_path, file_path):
+    def get_file(self, obj_path, file_path, progress=True):
         filename = os.path.basename(obj_path)
         obj = self.bucket.Object(obj_path)
-        with make_progress_bar(filename, obj.content_length) as pbar:
+        with make_progress_bar(filename, obj.content_length,
+                               progress) as pbar:
             obj.download_file(file_path, Callback=BotoProgress(pbar))
 
-    def put_file(self, obj_path, file_path):
+    def put_file(self, obj_path, file_path, progress=True):
         filename = os.path.basename(file_path)
         file_size = os.path.getsize(file_path)
-        with make_progress_bar(filename, file_size) as pbar:
+        with make_progress_bar(filename, file_size, progress) as pbar:
             self.bucket.upload_file(
                 file_path, obj_path, Callback=BotoProgress(pbar))
 
@@ -219,6 +309,11 @@ class BotoStorage(Storage):
         self.bucket.upload_fileobj(
             stream, obj_path, ExtraArgs={'Metadata': metadata})
 
+    def put_lines(self, obj_path, lines, metadata={}):
+        stream = BytesIO(b''.join(iter_lines(lines)))
+        self.bucket.upload_fileobj(
+            stream, obj_path, ExtraArgs={'Metadata': metadata})
+
 
 DRIVERS = {
     'gs': BotoStorage,
@@ -1,14 +1,12 @@
+import contextlib
 import os
 import subprocess
 import sys
 
 import jaraco.windows.filesystem as fs
 import win32con
-from win32com.shell import shell, shellcon
 
 import win32api
-import win32event
-import win32process
 
 
 def _respawn_as_administrator():
@@ -23,6 +21,9 @@ def _respawn_as_administrator():
         int: The exit code of the elevated process.
     """
     #pylint: disable=no-name-in-module,import-error
+    import win32event
+    import win32process
+    from win32com.shell import shell, shellcon
     try:
         process = shell.ShellExecuteEx(
             lpVerb='runas',
@@ -32,29 +33,49 @@ def _respawn_as_administrator():
     except:
         sys.exit('Could not elevate to administrator privileges')
     handle = process['hProcess']
-    win32event.WaitForSingleObject(handle, win32event.INFINITE)
+    # wait in short slices so Ctrl-C still reaches us
+    while win32event.WaitForSingleObject(
+            handle, 250) == win32event.WAIT_TIMEOUT:
+        pass
     exitcode = win32process.GetExitCodeProcess(handle)
     win32api.CloseHandle(handle)
     return exitcode
 
 
+@contextlib.contextmanager
+def _open_key(hive, path, access):
+    """Open a registry key, closing its handle when done."""
+    key = win32api.RegOpenKey(hive, path, 0, access)
+    try:
+        yield key
+    finally:
+        win32api.RegCloseKey(key)
+
+
 class DevMode(object):
     HIVE = win32con.HKEY_LOCAL_MACHINE
     KEY = 'SOFTWARE\Microsoft\Windows\CurrentVersion\AppModelUnlock'
     NAME = 'AllowDevelopmentWithoutDevLicense'
 
+    # the setting only changes through enable(), so read it once per process
+    _enabled = None
+
     def check(self):
         if os.getenv('APPVEYOR'):
             return True
-        key = win32api.RegOpenKey(DevMode.HIVE, DevMode.KEY, 0,
-                                  win32con.KEY_READ)
-        value, _ = win32api.RegQueryValueEx(key, DevMode.NAME)
-        return value == 1
+        if DevMode._enabled is None:
+            with _open_key(DevMode.HIVE, DevMode.KEY,
+                           win32con.KEY_READ) as key:
+                value, _ = win32api.RegQueryValueEx(key, DevMode.NAME)
+            DevMode._enabled = value == 1
+        return DevMode._enabled
 
     def enable(self):
-        key = win32api.RegOpenKey(DevMode.HIVE, DevMode.KEY, 0,
-                                  win32con.KEY_SET_VALUE)
-        win32api.RegSetValueEx(key, DevMode.NAME, 0, win32con.REG_DWORD, 1)
+        with _open_key(DevMode.HIVE, DevMode.KEY,
+                       win32con.KEY_SET_VALUE) as key:
+            win32api.RegSetValueEx(key, DevMode.NAME, 0, win32con.REG_DWORD,
+                                   1)
+        DevMode._enabled = True
 
 
 def enable_git_symlinks():
@@ -63,9 +84,14 @@ def enable_git_symlinks():
         ['git', 'config', '--system', 'core.symlinks', 'true'],
         ['git', 'config', '--global', 'core.symlinks', 'true'],
     ]
+    # each command writes a different config file, so run them together
+    procs = []
     for cmd in cmds:
         print('  ' + ' '.join(cmd))
-        subprocess.check_call(cmd)
+        procs.append((cmd, subprocess.Popen(cmd)))
+    for cmd, proc in procs:
+        if proc.wait():
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
 
 
 def enable_dev_mode():
@@ -85,6 +111,9 @@ def check():
 
 
 def setup():
+    # only windows-setup needs the shell APIs; keep them off the startup path
+    #pylint: disable=no-name-in-module,import-error
+    from win32com.shell import shell
     if not shell.IsUserAnAdmin():
         return _respawn_as_administrator()
     enable_dev_mode()
@@ -106,9 +135,9 @@ class WindowsFileSystem(object):
         This follows symbolic links, so both islink() and isfile() can be true for the same path.
         """
         if self.islink(path):
-            if not start:
-                start = os.path.abspath('.')
-            path = os.path.join(start, fs.readlink(path))
+            target = fs.readlink(path)
+            # a relative target already resolves against the cwd by default
+            path = os.path.join(start, target) if start else target
         return os.path.isfile(path)
 
     def readlink(self, path):
@@ -15,14 +15,18 @@
 from __future__ import print_function
 
 import contextlib
+import errno
 import os
 import platform
+import socket
+import stat
 import time
 from subprocess import Popen, check_output
 
 import pytest
+from click.testing import CliRunner
 
-from git_big.main import fs
+from git_big.main import cli, ensure_dir, fs
 
 if platform.system() == 'Windows':
     import git_big.windows
@@ -34,6 +38,20 @@ WORLD_CONTENT = 'world'
 WORLD_DIGEST = '486ea46224d1bb4fb680f34f7c9ad96a8f24ec88be73ea8e5a6c65260e9cb8a7'
 
 
+RUNNER = CliRunner()
+
+
+def invoke_git_big(*args):
+    """Run a git-big command in this process rather than spawning one"""
+    return RUNNER.invoke(cli, list(args), catch_exceptions=False)
+
+
+def git_big(*args):
+    result = invoke_git_big(*args)
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
 class Context(object):
     def __init__(self, tmpdir):
         self.root_dir = str(tmpdir)
@@ -42,16 +60,28 @@ class Context(object):
         self.depot_dir = os.path.join(self.root_dir, 'depot')
         self.bucket_dir = os.path.join(self.depot_dir, 'bucket')
         self.depot_config = None
-        if not os.path.exists(self.bucket_dir):
-            os.makedirs(self.bucket_dir)
+        ensure_dir(self.bucket_dir)
 
     def git_big_init(self, depot_config):
-        check_output(['git', 'config', 'user.email', 'you@example.com'])
-        check_output(['git', 'config', 'user.name', 'Your Name'])
-        check_output(['git', 'config', 'git-big.cache-dir', self.cache_dir])
-        check_output([
-            'git',
-            'big',
+        # append the settings in one write rather than a git process for each;
+        # automatic gc and maintenance only add latency to these tiny repos
+        # (gc.autoDetach has no effect once gc.auto is 0, and core.fsmonitor
+        # is already off by default)
+        git_dir = os.path.join(self.repo_dir, '.git')
+        if not os.path.isdir(git_dir):
+            git_dir = self.repo_dir  # bare
+        with open(os.path.join(git_dir, 'config'), 'a') as file_:
+            file_.write('[user]\n'
+                        '\temail = you@example.com\n'
+                        '\tname = Your Name\n'
+                        '[gc]\n'
+                        '\tauto = 0\n'
+                        '[maintenance]\n'
+                        '\tauto = false\n'
+                        '[git-big]\n'
+                        '\tcache-dir = "%s"\n' % self.cache_dir.replace(
+                            '\\', '\\\\').replace('"', '\\"'))
+        git_big(
             'set-depot',
             '--url',
             depot_config['url'],
@@ -59,8 +89,8 @@ class Context(object):
             depot_config['access_key'],
             '--secret',
             depot_config.get('secret_key', ''),
-        ])
-        check_output(['git', 'big', 'init'])
+        )
+        git_big('init')
         self.depot_config = depot_config
 
     def clone(self, repo_dir='clone', cache_dir='cache'):
@@ -73,6 +103,16 @@ class Context(object):
         return ctx
 
 
+def free_port():
+    # a private port per minio lets pytest-xdist workers run side by side
+    sock = socket.socket()
+    try:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
 @contextlib.contextmanager
 def libcloud_env(ctx):
     depot_config = {
@@ -85,7 +125,7 @@ def libcloud_env(ctx):
 @contextlib.contextmanager
 def boto_env(ctx):
     bucket = 'bucket'
-    minio_netloc = '127.0.0.1:9000'
+    minio_netloc = '127.0.0.1:{}'.format(free_port())
     endpoint_url = 'http://{}'.format(minio_netloc)
     depot_config = {
         'url': 's3+{}/{}'.format(endpoint_url, bucket),
@@ -144,26 +184,83 @@ def depot_env(tmpdir, request):
         yield context
 
 
+def write_file(path, content):
+    with open(path, 'w') as file_:
+        file_.write(content)
+
+
+def object_path(digest):
+    return os.path.join(digest[:2], digest[2:4], digest)
+
+
 def check_locked_file(env, file_, digest, root_dir=None):
     if not root_dir:
         root_dir = env.repo_dir
-    anchors_path = os.path.join(root_dir, '.gitbig-anchors', digest[:2],
-                                digest[2:4], digest)
+    obj_path = object_path(digest)
+    anchors_path = os.path.join(root_dir, '.gitbig-anchors', obj_path)
     symlink_path = os.path.relpath(anchors_path, os.path.dirname(file_))
-    cache_path = os.path.join(env.cache_dir, 'objects', digest[:2],
-                              digest[2:4], digest)
+    cache_path = os.path.join(env.cache_dir, 'objects', obj_path)
 
-    assert fs.isfile(anchors_path)
-    assert fs.isfile(cache_path)
+    anchors_st = os.stat(anchors_path)
+    cache_st = os.stat(cache_path)
+    assert stat.S_ISREG(anchors_st.st_mode)
+    assert stat.S_ISREG(cache_st.st_mode)
     assert fs.islink(file_)
     assert fs.readlink(file_) == symlink_path
-    assert os.stat(anchors_path).st_ino == os.stat(cache_path).st_ino
+    assert anchors_st.st_ino == cache_st.st_ino
 
     # once the file is added, it should be read-only
     with pytest.raises(Exception):
         file_.write('fail')
 
 
+def cross_devices(monkeypatch, ctx):
+    '''Make the working tree, cache and anchors look like separate devices'''
+
+    def exdev(*args):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+    rename = os.rename
+
+    def in_cache(path):
+        return os.path.abspath(path).startswith(ctx.cache_dir + os.sep)
+
+    def rename_within_device(src, dst):
+        if in_cache(src) != in_cache(dst):
+            exdev()
+        rename(src, dst)
+
+    monkeypatch.setattr(fs, 'link', exdev)
+    monkeypatch.setattr(os, 'rename', rename_within_device)
+
+
+def check_copied_file(env, file_, digest, content, root_dir=None):
+    '''Like check_locked_file, for anchors copied rather than hardlinked'''
+    if not root_dir:
+        root_dir = env.repo_dir
+    obj_path = object_path(digest)
+    anchors_path = os.path.join(root_dir, '.gitbig-anchors', obj_path)
+    symlink_path = os.path.relpath(anchors_path, os.path.dirname(file_))
+    cache_path = os.path.join(env.cache_dir, 'objects', obj_path)
+
+    anchors_st = os.stat(anchors_path)
+    cache_st = os.stat(cache_path)
+    assert stat.S_ISREG(anchors_st.st_mode)
+    assert stat.S_ISREG(cache_st.st_mode)
+    assert fs.islink(file_)
+    assert fs.readlink(file_) == symlink_path
+    assert anchors_st.st_ino != cache_st.st_ino
+
+    for path in (anchors_path, cache_path):
+        with open(path) as obj:
+            assert obj.read() == content
+
+    # both copies should be read-only
+    write_bits = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+    assert not anchors_st.st_mode & write_bits
+    assert not cache_st.st_mode & write_bits
+
+
 def check_status(expected):
     status = check_output(['git', 'status', '-s']).decode()
     if expected:
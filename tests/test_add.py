@@ -16,16 +16,19 @@ from __future__ import print_function
 
 import os
 from os.path import join
-from subprocess import check_call, check_output
+from subprocess import check_output
+
+import pytest
 
 # pylint: disable=unused-argument,W0621
 from conftest import (HELLO_CONTENT, HELLO_DIGEST, WORLD_CONTENT, WORLD_DIGEST,
-                      check_locked_file, check_status)
+                      check_copied_file, check_locked_file, check_status,
+                      cross_devices, git_big, write_file)
 
 
 def add_file(env, file_, digest, expected_status):
     # add the file to git-big
-    check_call(['git', 'big', 'add', file_])
+    git_big('add', file_)
 
     # git should now ignore the new file
     check_status(expected_status)
@@ -36,7 +39,7 @@ def add_file(env, file_, digest, expected_status):
 def test_add(env):
     '''Adding a file should link to a single cache object'''
     file_ = join(env.repo_dir, 'foo')
-    open(file_, 'w').write(HELLO_CONTENT)
+    write_file(file_, HELLO_CONTENT)
 
     # git should report that the repo is dirty
     check_status(['A  .gitattributes', '?? foo'])
@@ -48,7 +51,7 @@ def test_add(env):
 def test_add_same_multi(env):
     '''Adding a file a second time should be a nop'''
     file_ = join(env.repo_dir, 'foo')
-    open(file_, 'w').write(HELLO_CONTENT)
+    write_file(file_, HELLO_CONTENT)
 
     # git should report that the repo is dirty
     check_status(['A  .gitattributes', '?? foo'])
@@ -62,9 +65,9 @@ def test_add_same_multi(env):
 def test_add_same_content(env):
     '''Adding a file with the same content twice should link to a single cache object'''
     file1 = join(env.repo_dir, 'foo')
-    open(file1, 'w').write(HELLO_CONTENT)
+    write_file(file1, HELLO_CONTENT)
     file2 = join(env.repo_dir, 'bar')
-    open(file2, 'w').write(HELLO_CONTENT)
+    write_file(file2, HELLO_CONTENT)
 
     # git should report that the repo is dirty
     check_status(['A  .gitattributes', '?? bar', '?? foo'])
@@ -78,7 +81,7 @@ def test_add_same_content(env):
 def test_add_changed(env):
     '''Adding a file and then changing its content should result in a new link'''
     file_ = join(env.repo_dir, 'foo')
-    open(file_, 'w').write(HELLO_CONTENT)
+    write_file(file_, HELLO_CONTENT)
 
     # git should report that the repo is dirty
     check_status(['A  .gitattributes', '?? foo'])
@@ -87,10 +90,10 @@ def test_add_changed(env):
              ['A  .gitattributes', 'A  .gitbig', 'A  foo'])
 
     # unlock the file
-    check_output(['git', 'big', 'unlock', file_])
+    git_big('unlock', file_)
 
     os.unlink(file_)
-    open(file_, 'w').write(WORLD_CONTENT)
+    write_file(file_, WORLD_CONTENT)
 
     add_file(env, file_, WORLD_DIGEST,
              ['A  .gitattributes', 'A  .gitbig', 'A  foo'])
@@ -104,14 +107,14 @@ def test_add_directory(env):
     file2 = join(dir2, 'foo')
     os.makedirs(dir2)
 
-    open(file1, 'w').write(HELLO_CONTENT)
-    open(file2, 'w').write(WORLD_CONTENT)
+    write_file(file1, HELLO_CONTENT)
+    write_file(file2, WORLD_CONTENT)
 
     # git should report that the repo is dirty
     check_status(['A  .gitattributes', '?? dir/'])
 
     # add the directory to git-big
-    check_output(['git', 'big', 'add', 'dir'])
+    git_big('add', 'dir')
 
     # git should now ignore the new files
     check_status(
@@ -121,19 +124,67 @@ def test_add_directory(env):
     check_locked_file(env, file2, WORLD_DIGEST)
 
 
+@pytest.mark.parametrize('jobs', ['4', '0'])
+def test_add_directory_jobs(env, jobs):
+    '''Hashing files in parallel should give the same result as serially'''
+    dir1 = join(env.repo_dir, 'dir')
+    file1 = join(dir1, 'foo')
+    file2 = join(dir1, 'bar')
+    os.makedirs(dir1)
+
+    write_file(file1, HELLO_CONTENT)
+    write_file(file2, WORLD_CONTENT)
+
+    git_big('add', '--jobs', jobs, 'dir')
+
+    check_status(
+        ['A  .gitattributes', 'A  .gitbig', 'A  dir/bar', 'A  dir/foo'])
+
+    check_locked_file(env, file1, HELLO_DIGEST)
+    check_locked_file(env, file2, WORLD_DIGEST)
+
+
+@pytest.mark.parametrize('jobs', ['1', '4'])
+def test_add_overlapping_paths(env, jobs):
+    '''Adding a directory and a file inside it should add the file once'''
+    dir1 = join(env.repo_dir, 'dir')
+    file1 = join(dir1, 'foo')
+    os.makedirs(dir1)
+
+    write_file(file1, HELLO_CONTENT)
+
+    git_big('add', '--jobs', jobs, 'dir', 'dir/foo', './dir/foo')
+
+    check_status(['A  .gitattributes', 'A  .gitbig', 'A  dir/foo'])
+
+    check_locked_file(env, file1, HELLO_DIGEST)
+
+
+def test_add_across_devices(env, monkeypatch):
+    '''Adding should copy when the cache is on another device'''
+    file_ = join(env.repo_dir, 'foo')
+    write_file(file_, HELLO_CONTENT)
+
+    cross_devices(monkeypatch, env)
+    git_big('add', file_)
+
+    check_status(['A  .gitattributes', 'A  .gitbig', 'A  foo'])
+    check_copied_file(env, file_, HELLO_DIGEST, HELLO_CONTENT)
+
+
 def test_add_gitignore(env):
     '''Adding a file that is ignored by git should succeed'''
     gitignore = join(env.repo_dir, '.gitignore')
-    open(gitignore, 'w').write('*.foo\n')
+    write_file(gitignore, '*.foo\n')
 
     # add .gitignore file
-    check_output(['git', 'big', 'add', gitignore])
-    check_output(['git', 'commit', '-m', 'message'])
+    git_big('add', gitignore)
+    check_output(['git', 'commit', '-q', '-m', 'message'])
 
     # add file that is ignored
     test_file = join(env.repo_dir, 'some.foo')
-    open(test_file, 'w').write(HELLO_CONTENT)
+    write_file(test_file, HELLO_CONTENT)
     add_file(env, test_file, HELLO_DIGEST, ['M  .gitbig', 'A  some.foo'])
 
     # ensure commits work
-    check_output(['git', 'commit', '-m', 'message'])
+    check_output(['git', 'commit', '-q', '-m', 'message'])
@@ -15,17 +15,18 @@
 from __future__ import print_function
 
 from os.path import join
-from subprocess import check_output, check_call
+from subprocess import check_output
 
 # pylint: disable=unused-argument,W0621
 from conftest import (HELLO_CONTENT, HELLO_DIGEST, check_locked_file,
-                      check_status)
+                      check_status, git_big,
+                      write_file)
 
 
 def test_copy(env):
     '''Copying a file should create another link'''
     source = join(env.repo_dir, 'foo')
-    open(source, 'w').write(HELLO_CONTENT)
+    write_file(source, HELLO_CONTENT)
 
     dest = join(env.repo_dir, 'bar')
 
@@ -33,13 +34,12 @@ def test_copy(env):
     check_status(['A  .gitattributes', '?? foo'])
 
     # add the file to git-big
-    check_output(['git', 'big', 'add', source])
+    git_big('add', source)
 
     # copy the link
-    check_output(['git', 'big', 'cp', source, dest])
+    git_big('cp', source, dest)
 
     # git should track the source and dest
-    check_call(['git', 'status'])
     check_status(['A  .gitattributes', 'A  .gitbig', 'A  bar', 'A  foo'])
 
     # we should have two links to the same object
@@ -50,7 +50,7 @@ def test_copy(env):
 def test_copy_after_commit(env):
     '''Copying a file after a commit should create another link'''
     source = join(env.repo_dir, 'foo')
-    open(source, 'w').write(HELLO_CONTENT)
+    write_file(source, HELLO_CONTENT)
 
     dest = join(env.repo_dir, 'bar')
 
@@ -58,16 +58,15 @@ def test_copy_after_commit(env):
     check_status(['A  .gitattributes', '?? foo'])
 
     # add the file to git-big
-    check_output(['git', 'big', 'add', source])
+    git_big('add', source)
 
     # make a commit
-    check_output(['git', 'commit', '-m', 'commit'])
+    check_output(['git', 'commit', '-q', '-m', 'commit'])
 
     # copy the link
-    check_output(['git', 'big', 'cp', source, dest])
+    git_big('cp', source, dest)
 
     # git should track the source and dest
-    check_call(['git', 'status'])
     check_status(['M  .gitbig', 'A  bar'])
 
     # we should have two links to the same object
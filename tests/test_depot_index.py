@@ -0,0 +1,83 @@
+# Copyright (c) 2017 Vertex.AI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import io
+from os.path import join
+
+from conftest import HELLO_DIGEST, WORLD_DIGEST
+from git_big.main import DepotIndex
+
+
+def write_log(path, content):
+    with io.open(path, 'wb') as file_:
+        file_.write(content.encode())
+
+
+def read_log(path):
+    with io.open(path, 'rb') as file_:
+        return file_.read().decode()
+
+
+def test_depot_index_later_lines_win(tmpdir):
+    '''Later lines should supersede earlier ones without a rewrite'''
+    path = join(str(tmpdir), 'index')
+    content = '{0} 1\n{1} 2\n{0} 3\n'.format(HELLO_DIGEST, WORLD_DIGEST)
+    write_log(path, content)
+
+    index = DepotIndex(path)
+    assert index.has_digest(HELLO_DIGEST) == 3
+    assert index.has_digest(WORLD_DIGEST) == 2
+    assert index.has_digest('0' * 64) is None
+
+    # 3 lines for 2 entries is below the compaction threshold
+    assert read_log(path) == content
+
+
+def test_depot_index_compact(tmpdir):
+    '''Mostly superseded logs and torn appends should be compacted on load'''
+    path = join(str(tmpdir), 'index')
+    write_log(path, ''.join([
+        '{} 1\n'.format(HELLO_DIGEST),
+        '{} 2\n'.format(HELLO_DIGEST),
+        '{} 3\n'.format(WORLD_DIGEST),
+        '{} 4\n'.format(HELLO_DIGEST),
+        '{} 5\n'.format(HELLO_DIGEST),
+        # an interrupted append of '<WORLD_DIGEST> 678\n'
+        '{} 6'.format(WORLD_DIGEST),
+    ]))
+
+    index = DepotIndex(path)
+    assert index.has_digest(HELLO_DIGEST) == 5
+    assert index.has_digest(WORLD_DIGEST) == 3
+    assert sorted(read_log(path).splitlines()) == sorted([
+        '{} 5'.format(HELLO_DIGEST),
+        '{} 3'.format(WORLD_DIGEST),
+    ])
+
+
+def test_depot_index_torn_append(tmpdir):
+    '''An append after a torn line should still be read back'''
+    path = join(str(tmpdir), 'index')
+    write_log(path, '{} 1\n{}'.format(HELLO_DIGEST, WORLD_DIGEST[:10]))
+
+    index = DepotIndex(path)
+    assert index.has_digest(HELLO_DIGEST) == 1
+    index.add_digest(WORLD_DIGEST, 2)
+    index.flush()
+
+    index = DepotIndex(path)
+    assert index.has_digest(HELLO_DIGEST) == 1
+    assert index.has_digest(WORLD_DIGEST) == 2
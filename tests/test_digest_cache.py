@@ -0,0 +1,124 @@
+# Copyright (c) 2017 Vertex.AI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import io
+import os
+import time
+from os.path import join
+
+from conftest import (HELLO_CONTENT, HELLO_DIGEST, WORLD_CONTENT, WORLD_DIGEST,
+                      write_file)
+from git_big.main import DigestCache
+
+# an arbitrary fixed time, well in the past
+MTIME = 1500000000
+
+
+def bump_ctime(path):
+    '''Change the ctime of a file without touching its content or mtime'''
+    ctime = os.stat(path).st_ctime
+    while os.stat(path).st_ctime == ctime:
+        time.sleep(0.01)
+        os.chmod(path, os.stat(path).st_mode)
+
+
+def add_file(cache, root, rel_path, content, digest):
+    path = join(root, rel_path)
+    write_file(path, content)
+    os.utime(path, (MTIME, MTIME))
+    cache.add(rel_path, os.stat(path), digest)
+    return path
+
+
+def saved_paths(cache):
+    with io.open(cache.path, 'r', encoding='utf-8') as file_:
+        return sorted(x.rstrip('\n').split(' ', 6)[6] for x in file_)
+
+
+def test_digest_cache_hit(tmpdir):
+    '''A saved entry should be returned while the file is unchanged'''
+    root = str(tmpdir)
+    cache = DigestCache(join(root, 'cache'), root)
+    path = add_file(cache, root, 'foo', HELLO_CONTENT, HELLO_DIGEST)
+    cache.save()
+    os.utime(cache.path, (MTIME + 1, MTIME + 1))
+
+    cache = DigestCache(cache.path, root)
+    assert cache.get('foo', os.stat(path)) == HELLO_DIGEST
+    assert cache.get('bar', os.stat(path)) is None
+
+
+def test_digest_cache_racy(tmpdir):
+    '''An entry modified no earlier than the cache was saved is ignored'''
+    root = str(tmpdir)
+    cache = DigestCache(join(root, 'cache'), root)
+    path = add_file(cache, root, 'foo', HELLO_CONTENT, HELLO_DIGEST)
+    cache.save()
+
+    # the file could have been modified again within the same timestamp
+    os.utime(cache.path, (MTIME, MTIME))
+    assert DigestCache(cache.path, root).get('foo', os.stat(path)) is None
+
+    os.utime(cache.path, (MTIME - 1, MTIME - 1))
+    assert DigestCache(cache.path, root).get('foo', os.stat(path)) is None
+
+    os.utime(cache.path, (MTIME + 1, MTIME + 1))
+    assert DigestCache(cache.path, root).get('foo',
+                                             os.stat(path)) == HELLO_DIGEST
+
+
+def test_digest_cache_invalidated(tmpdir):
+    '''Changing the size or ctime of a file should invalidate its entry'''
+    root = str(tmpdir)
+    cache = DigestCache(join(root, 'cache'), root)
+    file1 = add_file(cache, root, 'foo', HELLO_CONTENT, HELLO_DIGEST)
+    file2 = add_file(cache, root, 'bar', HELLO_CONTENT, HELLO_DIGEST)
+    cache.save()
+    os.utime(cache.path, (MTIME + 1, MTIME + 1))
+
+    cache = DigestCache(cache.path, root)
+    st1 = os.stat(file1)
+    st2 = os.stat(file2)
+    assert cache.get('foo', st1) == HELLO_DIGEST
+    assert cache.get('bar', st2) == HELLO_DIGEST
+
+    # same mtime, different size
+    write_file(file1, HELLO_CONTENT + WORLD_CONTENT)
+    os.utime(file1, (MTIME, MTIME))
+    assert os.stat(file1).st_mtime == st1.st_mtime
+    assert cache.get('foo', os.stat(file1)) is None
+
+    # same size and mtime, different ctime
+    write_file(file2, WORLD_CONTENT)
+    os.utime(file2, (MTIME, MTIME))
+    bump_ctime(file2)
+    assert os.stat(file2).st_size == st2.st_size
+    assert os.stat(file2).st_mtime == st2.st_mtime
+    assert cache.get('bar', os.stat(file2)) is None
+
+
+def test_digest_cache_prune(tmpdir):
+    '''Saving should drop entries for files that changed or disappeared'''
+    root = str(tmpdir)
+    cache = DigestCache(join(root, 'cache'), root)
+    file1 = add_file(cache, root, 'foo', HELLO_CONTENT, HELLO_DIGEST)
+    file2 = add_file(cache, root, 'bar', WORLD_CONTENT, WORLD_DIGEST)
+    add_file(cache, root, 'baz', WORLD_CONTENT, WORLD_DIGEST)
+    write_file(file1, WORLD_CONTENT + HELLO_CONTENT)
+    os.unlink(file2)
+    cache.save()
+
+    assert saved_paths(cache) == ['baz']
@@ -16,10 +16,10 @@ from __future__ import print_function
 
 import os
 from os.path import join
-from subprocess import check_call, check_output
+from subprocess import check_output
 
 # pylint: disable=unused-argument,W0621
-from conftest import HELLO_CONTENT
+from conftest import HELLO_CONTENT, git_big, write_file
 
 
 def test_subdir(env):
@@ -31,8 +31,8 @@ def test_subdir(env):
     os.chdir(join(env.repo_dir, 'foo'))
     try:
         file_ = 'bar'
-        open(file_, 'w').write(HELLO_CONTENT)
-        check_call(['git', 'big', 'add', file_])
-        check_output(['git', 'commit', '-m', 'message'])
+        write_file(file_, HELLO_CONTENT)
+        git_big('add', file_)
+        check_output(['git', 'commit', '-q', '-m', 'message'])
     finally:
         os.chdir(prev_dir)
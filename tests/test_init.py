@@ -12,10 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 from subprocess import check_output
 
 # pylint: disable=unused-argument,W0621
 import pytest
+from six.moves import configparser
+
+from conftest import git_big
+from git_big.main import walk_files
 
 HOOKS = [
     'pre-push',
@@ -24,6 +29,12 @@ HOOKS = [
 ]
 
 
+def hook_files(tmpdir):
+    # one directory listing covers every hook
+    hooks_dir = tmpdir.join('.git', 'hooks').strpath
+    return set(os.path.basename(path) for path in walk_files(hooks_dir))
+
+
 @pytest.fixture
 def setup(tmpdir):
     tmpdir.chdir()
@@ -32,14 +43,15 @@ def setup(tmpdir):
 
 def do_init(tmpdir):
     check_output(['git', 'init'])
-    check_output(['git', 'big', 'init'])
+    git_big('init')
     # check uuid was created
-    check_output(['git', 'config', 'git-big.uuid'])
+    config = configparser.ConfigParser()
+    config.read(tmpdir.join('.git', 'config').strpath)
+    assert config.get('git-big', 'uuid')
     # check .gitbig file was created
     tmpdir.join('.gitbig').check(file=1)
     # check hooks were created
-    for hook in HOOKS:
-        assert tmpdir.join('.git', 'hooks', hook).check(file=1)
+    assert set(HOOKS) <= hook_files(tmpdir)
 
 
 def test_init(setup):
@@ -49,8 +61,7 @@ def test_init(setup):
 def test_init_multi(setup):
     do_init(setup)
     do_init(setup)
-    for hook in HOOKS:
-        assert setup.join('.git', 'hooks', hook + '.git-big').check(exists=0)
+    assert not set(hook + '.git-big' for hook in HOOKS) & hook_files(setup)
 
 
 def test_init_chain(setup):
@@ -59,5 +70,4 @@ def test_init_chain(setup):
         file_ = setup.join('.git', 'hooks', hook)
         file_.write('#!/bin/sh\necho "Hello"')
     do_init(setup)
-    for hook in HOOKS:
-        assert setup.join('.git', 'hooks', hook + '.git-big').check(file=1)
+    assert set(hook + '.git-big' for hook in HOOKS) <= hook_files(setup)
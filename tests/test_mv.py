@@ -15,17 +15,18 @@
 from __future__ import print_function
 
 from os.path import exists, join
-from subprocess import check_output, check_call
+from subprocess import check_output
 
 # pylint: disable=unused-argument,W0621
 from conftest import (HELLO_CONTENT, HELLO_DIGEST, check_locked_file,
-                      check_status)
+                      check_status, git_big,
+                      write_file)
 
 
 def test_move(env):
     '''Moving a file should move the link'''
     source = join(env.repo_dir, 'foo')
-    open(source, 'w').write(HELLO_CONTENT)
+    write_file(source, HELLO_CONTENT)
 
     dest = join(env.repo_dir, 'bar')
 
@@ -33,13 +34,12 @@ def test_move(env):
     check_status(['A  .gitattributes', '?? foo'])
 
     # add the file to git-big
-    check_output(['git', 'big', 'add', source])
+    git_big('add', source)
 
     # move the link
-    check_output(['git', 'big', 'mv', source, dest])
+    git_big('mv', source, dest)
 
     # git should track the dest
-    check_call(['git', 'status'])
     check_status(['A  .gitattributes', 'A  .gitbig', 'A  bar'])
 
     # the file should now be moved
@@ -50,7 +50,7 @@ def test_move(env):
 def test_move_after_commit(env):
     '''Moving a file after a commit should move the link'''
     source = join(env.repo_dir, 'foo')
-    open(source, 'w').write(HELLO_CONTENT)
+    write_file(source, HELLO_CONTENT)
 
     dest = join(env.repo_dir, 'bar')
 
@@ -58,16 +58,15 @@ def test_move_after_commit(env):
     check_status(['A  .gitattributes', '?? foo'])
 
     # add the file to git-big
-    check_output(['git', 'big', 'add', source])
+    git_big('add', source)
 
     # make a commit
-    check_output(['git', 'commit', '-m', 'commit'])
+    check_output(['git', 'commit', '-q', '-m', 'commit'])
 
     # move the link
-    check_output(['git', 'big', 'mv', source, dest])
+    git_big('mv', source, dest)
 
     # git should track the dest
-    check_call(['git', 'status'])
     check_status(['M  .gitbig', 'R  foo -> bar'])
 
     # the file should now be moved
@@ -14,34 +14,36 @@
 
 from __future__ import print_function
 
+import glob
 import os
+import stat
 from os.path import join
-from subprocess import call, check_call, check_output
+from subprocess import check_call, check_output
 
-import pytest
+from libcloud.storage.base import Container
 
 # pylint: disable=unused-argument,W0621
 from conftest import (HELLO_CONTENT, HELLO_DIGEST, WORLD_CONTENT, WORLD_DIGEST,
-                      check_locked_file, check_status)
-from git_big.main import fs
+                      check_copied_file, check_locked_file, check_status,
+                      cross_devices, git_big, invoke_git_big, object_path,
+                      write_file)
+from git_big.main import fs, walk_files
 
 
 def make_origin(depot_env):
     # add files
     foo = join(depot_env.repo_dir, 'foo')
-    open(foo, 'w').write(HELLO_CONTENT)
-    check_output(['git', 'big', 'add', foo])
+    write_file(foo, HELLO_CONTENT)
 
     bar = join(depot_env.repo_dir, 'bar')
-    open(bar, 'w').write(WORLD_CONTENT)
-    check_output(['git', 'big', 'add', bar])
+    write_file(bar, WORLD_CONTENT)
+    git_big('add', foo, bar)
 
     # push up to the depot
-    check_output(['git', 'big', 'push'])
+    git_big('push')
 
     # commit the changes
-    check_call(['git', 'status'])
-    check_output(['git', 'commit', '-m', 'commit message'])
+    check_output(['git', 'commit', '-q', '-m', 'commit message'])
 
 
 def test_fresh_clone(depot_env):
@@ -54,7 +56,7 @@ def test_fresh_clone(depot_env):
     clone = depot_env.clone(cache_dir='clone_cache')
 
     # pull big files (initially soft)
-    check_call(['git', 'big', 'pull'])
+    git_big('pull')
 
     assert fs.islink(join(clone.repo_dir, 'foo'))
     assert fs.islink(join(clone.repo_dir, 'bar'))
@@ -63,44 +65,67 @@ def test_fresh_clone(depot_env):
     assert not fs.isfile(join(clone.repo_dir, 'bar'))
 
     # pull big files (now hard)
-    check_output(['git', 'big', 'pull', '--hard'])
+    git_big('pull', '--hard')
 
     assert fs.isfile(join(clone.repo_dir, 'foo'))
     assert fs.isfile(join(clone.repo_dir, 'bar'))
 
 
+def test_fresh_clone_jobs(depot_env):
+    '''Make a fresh clone and pull with parallel downloads'''
+
+    make_origin(depot_env)
+
+    clone = depot_env.clone(cache_dir='clone_cache')
+
+    git_big('pull', '--hard', '--jobs', '4')
+
+    check_locked_file(clone, join(clone.repo_dir, 'foo'), HELLO_DIGEST)
+    check_locked_file(clone, join(clone.repo_dir, 'bar'), WORLD_DIGEST)
+
+
+def test_fresh_clone_across_devices(env, monkeypatch):
+    '''Pulling should copy anchors when the cache is on another device'''
+    make_origin(env)
+
+    clone = env.clone(cache_dir='clone_cache')
+
+    cross_devices(monkeypatch, clone)
+    git_big('pull', '--hard')
+
+    check_copied_file(clone, join(clone.repo_dir, 'foo'), HELLO_DIGEST,
+                      HELLO_CONTENT)
+    check_copied_file(clone, join(clone.repo_dir, 'bar'), WORLD_DIGEST,
+                      WORLD_CONTENT)
+
+
 def check_anchors(depot_env, expected):
     anchors_dir = join(depot_env.repo_dir, '.gitbig-anchors')
-    actual = []
-    for _, _, files in os.walk(anchors_dir):
-        for file_ in files:
-            actual.append(file_)
-    assert actual == expected
+    actual = [os.path.basename(path) for path in walk_files(anchors_dir)]
+    assert sorted(actual) == sorted(expected)
 
 
 def test_checkout(depot_env):
     '''Switch between branches, hooks should pull and update links'''
     # add a file
     file_ = join(depot_env.repo_dir, 'foo')
-    open(file_, 'w').write(HELLO_CONTENT)
-    check_output(['git', 'big', 'add', file_])
+    write_file(file_, HELLO_CONTENT)
+    git_big('add', file_)
 
     # commit the changes
-    check_call(['git', 'status'])
-    check_output(['git', 'commit', '-m', '1st commit'])
+    check_output(['git', 'commit', '-q', '-m', '1st commit'])
     check_status([])
 
     # make a new branch
     check_output(['git', 'checkout', '-b', 'changed'])
 
     # change a file
-    check_output(['git', 'big', 'unlock', file_])
-    open(file_, 'w').write(WORLD_CONTENT)
-    check_output(['git', 'big', 'add', file_])
+    git_big('unlock', file_)
+    write_file(file_, WORLD_CONTENT)
+    git_big('add', file_)
 
     # commit the changes
-    check_call(['git', 'status'])
-    check_output(['git', 'commit', '-m', '2nd commit'])
+    check_output(['git', 'commit', '-q', '-m', '2nd commit'])
     check_status([])
 
     # switch back to 1st branch
@@ -119,30 +144,52 @@ def test_checkout(depot_env):
     check_anchors(depot_env, [HELLO_DIGEST])
 
 
+def test_checkout_new_branch(env):
+    '''Creating a branch without moving HEAD should not pull'''
+    file_ = join(env.repo_dir, 'foo')
+    write_file(file_, HELLO_CONTENT)
+    git_big('add', file_)
+    check_output(['git', 'commit', '-q', '-m', 'commit'])
+    git_big('push')
+
+    # every pull rewrites this repo's refs object in the depot
+    refs_path, = glob.glob(join(env.bucket_dir, 'refs', '*'))
+    write_file(refs_path, 'untouched')
+
+    check_output(['git', 'checkout', '-q', '-b', 'other'])
+    with open(refs_path) as refs:
+        assert refs.read() == 'untouched'
+    check_locked_file(env, file_, HELLO_DIGEST)
+
+    # checking out paths leaves HEAD alone too, but may change links
+    check_output(['git', 'checkout', '-q', '--', '.gitbig'])
+    with open(refs_path) as refs:
+        assert refs.read() != 'untouched'
+    check_locked_file(env, file_, HELLO_DIGEST)
+
+
 def test_checkout_diff_types(depot_env):
     '''Switch between branches, hooks should pull and update links.
     1st commit is a big file, 2nd commit is a normal file.'''
     # add a file
     file_ = join(depot_env.repo_dir, 'foo')
-    open(file_, 'w').write(HELLO_CONTENT)
-    check_output(['git', 'big', 'add', file_])
+    write_file(file_, HELLO_CONTENT)
+    git_big('add', file_)
 
     # commit the changes
-    check_call(['git', 'status'])
-    check_output(['git', 'commit', '-m', '1st commit'])
+    check_output(['git', 'commit', '-q', '-m', '1st commit'])
     check_status([])
 
     # make a new branch
     check_output(['git', 'checkout', '-b', 'changed'])
 
     # change a file
-    check_output(['git', 'big', 'unlock', file_])
-    open(file_, 'w').write(WORLD_CONTENT)
+    git_big('unlock', file_)
+    write_file(file_, WORLD_CONTENT)
     check_output(['git', 'add', file_])
 
     # commit the changes
-    check_call(['git', 'status'])
-    check_output(['git', 'commit', '-m', '2nd commit'])
+    check_output(['git', 'commit', '-q', '-m', '2nd commit'])
     check_status([])
 
     # switch back to 1st branch
@@ -168,40 +215,42 @@ def test_pull_file(depot_env):
     clone = depot_env.clone(cache_dir='clone_cache')
 
     # now pull a single file
-    check_output(['git', 'big', 'pull', 'foo'])
+    git_big('pull', 'foo')
 
     assert fs.isfile(join(clone.repo_dir, 'foo'))
     assert not fs.isfile(join(clone.repo_dir, 'bar'))
 
     # pulling a file again is ok
-    check_output(['git', 'big', 'pull', 'foo'])
+    git_big('pull', 'foo')
 
     assert fs.isfile(join(clone.repo_dir, 'foo'))
     assert not fs.isfile(join(clone.repo_dir, 'bar'))
 
     # pull another big file
-    check_output(['git', 'big', 'pull', 'bar'])
+    git_big('pull', 'bar')
 
     assert fs.isfile(join(clone.repo_dir, 'foo'))
     assert fs.isfile(join(clone.repo_dir, 'bar'))
 
     # pull an invalid file
-    ret = call(['git', 'big', 'pull', 'does_not_exist'])
-    assert ret != 0
+    result = invoke_git_big('pull', 'does_not_exist')
+    assert result.exit_code != 0
 
 
 def check_alt_hardlink(depot_env, file_path, digest):
     root_dir = depot_env.repo_dir
-    cache_path = os.path.join(depot_env.cache_dir, 'objects', digest[:2],
-                              digest[2:4], digest)
+    cache_path = os.path.join(depot_env.cache_dir, 'objects',
+                              object_path(digest))
 
-    assert fs.isfile(file_path)
-    assert fs.isfile(cache_path)
-    assert os.stat(file_path).st_ino == os.stat(cache_path).st_ino
+    file_st = os.stat(file_path)
+    cache_st = os.stat(cache_path)
+    assert stat.S_ISREG(file_st.st_mode)
+    assert stat.S_ISREG(cache_st.st_mode)
+    assert file_st.st_ino == cache_st.st_ino
 
-    with pytest.raises(Exception):
-        with open(file_path) as file_:
-            file_.write('fail')
+    # the extra link shares the cache's inode, so it must stay read-only
+    write_bits = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+    assert not file_st.st_mode & write_bits
 
 
 def test_pull_extra(depot_env):
@@ -215,7 +264,7 @@ def test_pull_extra(depot_env):
 
     # now pull a single file and also specify an extra path
     alt_foo = join(depot_env.root_dir, 'alt', 'foo')
-    check_output(['git', 'big', 'pull', 'foo', '--extra', alt_foo])
+    git_big('pull', 'foo', '--extra', alt_foo)
 
     # ensure that the alt file appears and that its read-only
     check_alt_hardlink(clone, alt_foo, HELLO_DIGEST)
@@ -232,8 +281,50 @@ def test_pull_extra_dir(depot_env):
 
     # now pull a single file and also specify an extra directory
     alt_dir = join(depot_env.root_dir, 'alt')
-    check_output(['git', 'big', 'pull', '--hard', '--extra', alt_dir])
+    git_big('pull', '--hard', '--extra', alt_dir)
 
     # ensure that the alt files appear and that they're read-only
     check_alt_hardlink(clone, join(alt_dir, 'foo'), HELLO_DIGEST)
     check_alt_hardlink(clone, join(alt_dir, 'bar'), WORLD_DIGEST)
+
+
+def check_not_cached(ctx, digest):
+    assert not os.path.exists(
+        join(ctx.cache_dir, 'objects', object_path(digest)))
+    assert os.listdir(join(ctx.cache_dir, 'tmp')) == []
+
+
+def test_pull_corrupt_object(env):
+    '''A download that does not match its digest should not be cached'''
+    make_origin(env)
+
+    # same size, different content
+    write_file(join(env.bucket_dir, 'objects', HELLO_DIGEST), WORLD_CONTENT)
+
+    clone = env.clone(cache_dir='clone_cache')
+    result = invoke_git_big('pull', '--hard')
+    assert result.exit_code != 0
+    assert 'Corrupt object in depot: {}'.format(HELLO_DIGEST) in result.output
+    check_not_cached(clone, HELLO_DIGEST)
+
+
+def test_pull_incomplete_download(env, monkeypatch):
+    '''A download that ends early should not be cached'''
+    make_origin(env)
+
+    download = Container.download_object_as_stream
+
+    def truncated(self, obj, chunk_size=None):
+        for chunk in download(self, obj, chunk_size=chunk_size):
+            yield chunk[:-1]
+            return
+
+    monkeypatch.setattr(Container, 'download_object_as_stream', truncated)
+
+    clone = env.clone(cache_dir='clone_cache')
+    result = invoke_git_big('pull', '--hard')
+    assert result.exit_code != 0
+    assert 'Download failed: ' in result.output
+    assert 'Incomplete download' in result.output
+    check_not_cached(clone, HELLO_DIGEST)
+    check_not_cached(clone, WORLD_DIGEST)
@@ -14,12 +14,17 @@
 
 from __future__ import print_function
 
+import glob
+import os
+import time
 from os.path import join
-from subprocess import check_call
+from subprocess import check_output
 
 # pylint: disable=unused-argument,W0621
-from conftest import HELLO_CONTENT, HELLO_DIGEST
-from git_big.main import fs
+from conftest import (HELLO_CONTENT, HELLO_DIGEST, WORLD_CONTENT, WORLD_DIGEST,
+                      Context, git_big, libcloud_env, write_file)
+from git_big.main import INDEX_TTL, compute_digest, fs
+from git_big.storage import LibcloudStorage
 
 
 def test_push(depot_env):
@@ -27,13 +32,109 @@ def test_push(depot_env):
 
     # add a file
     file_ = join(depot_env.repo_dir, 'foo')
-    open(file_, 'w').write(HELLO_CONTENT)
-    check_call(['git', 'big', 'add', file_])
+    write_file(file_, HELLO_CONTENT)
+    git_big('add', file_)
 
     # push up to the depot
-    check_call(['git', 'big', 'push'])
+    git_big('push')
 
     assert fs.isfile(join(depot_env.bucket_dir, 'objects', HELLO_DIGEST))
 
     # 2nd push should be a nop
-    check_call(['git', 'big', 'push'])
+    git_big('push')
+
+
+def test_push_jobs(depot_env):
+    '''Push several files up to the depot in parallel'''
+
+    foo = join(depot_env.repo_dir, 'foo')
+    write_file(foo, HELLO_CONTENT)
+    bar = join(depot_env.repo_dir, 'bar')
+    write_file(bar, WORLD_CONTENT)
+    git_big('add', foo, bar)
+
+    git_big('push', '--jobs', '4')
+
+    assert fs.isfile(join(depot_env.bucket_dir, 'objects', HELLO_DIGEST))
+    assert fs.isfile(join(depot_env.bucket_dir, 'objects', WORLD_DIGEST))
+
+
+def test_push_shared_cache(env, tmpdir):
+    '''Objects pushed to one depot should not be skipped for another'''
+    file_ = join(env.repo_dir, 'foo')
+    write_file(file_, HELLO_CONTENT)
+    git_big('add', file_)
+    git_big('push')
+    assert fs.isfile(join(env.bucket_dir, 'objects', HELLO_DIGEST))
+
+    # a second repo with its own depot, sharing the same cache
+    other = Context(tmpdir.mkdir('other'))
+    other.cache_dir = env.cache_dir
+    check_output(['git', 'init', '-q', other.repo_dir])
+    os.chdir(other.repo_dir)
+    with libcloud_env(other) as depot_config:
+        other.git_big_init(depot_config)
+
+    file_ = join(other.repo_dir, 'foo')
+    write_file(file_, HELLO_CONTENT)
+    git_big('add', file_)
+    git_big('push')
+    assert fs.isfile(join(other.bucket_dir, 'objects', HELLO_DIGEST))
+
+
+def count_requests(monkeypatch):
+    '''Record the lookups made against the depot'''
+    requests = []
+
+    def counting(name):
+        method = getattr(LibcloudStorage, name)
+
+        def wrapper(self, *args):
+            requests.append(name)
+            return method(self, *args)
+
+        return wrapper
+
+    for name in ('has_object', 'list_objects'):
+        monkeypatch.setattr(LibcloudStorage, name, counting(name))
+    return requests
+
+
+def test_push_list_or_probe(env, monkeypatch):
+    '''The depot should only be listed when many objects are unknown'''
+    monkeypatch.setattr('git_big.main.LIST_THRESHOLD', 2)
+    requests = count_requests(monkeypatch)
+    counter = [0]
+
+    def push_new_files(count):
+        for _ in range(count):
+            counter[0] += 1
+            file_ = join(env.repo_dir, 'file{}'.format(counter[0]))
+            write_file(file_, str(counter[0]))
+            git_big('add', file_)
+        del requests[:]
+        git_big('push')
+        return sorted(requests)
+
+    # too few unknown objects to be worth a listing
+    assert push_new_files(1) == ['has_object']
+
+    # enough unknown objects, and no listing yet
+    assert push_new_files(2) == ['list_objects']
+
+    # everything is in the index now
+    assert push_new_files(0) == []
+
+    # a listing within INDEX_TTL is not repeated; new objects are probed
+    assert push_new_files(2) == ['has_object', 'has_object']
+
+    # until it expires
+    listed_path, = glob.glob(join(env.cache_dir, 'listed', '*'))
+    then = time.time() - INDEX_TTL - 1
+    os.utime(listed_path, (then, then))
+    assert push_new_files(2) == ['list_objects']
+
+    for i in range(1, counter[0] + 1):
+        assert fs.isfile(join(env.bucket_dir, 'objects',
+                              compute_digest(join(env.repo_dir,
+                                                  'file{}'.format(i)))))
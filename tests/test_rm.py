@@ -18,22 +18,22 @@ from os.path import exists, join
 from subprocess import check_output
 
 # pylint: disable=unused-argument,W0621
-from conftest import (HELLO_CONTENT, check_status)
+from conftest import HELLO_CONTENT, check_status, git_big, write_file
 
 
 def test_remove(env):
     '''Removing a file should remove the link and index entry'''
     file_ = join(env.repo_dir, 'foo')
-    open(file_, 'w').write(HELLO_CONTENT)
+    write_file(file_, HELLO_CONTENT)
 
     # git should report that the repo is dirty
     check_status(['A  .gitattributes', '?? foo'])
 
     # add the file to git-big
-    check_output(['git', 'big', 'add', file_])
+    git_big('add', file_)
 
     # remove the file
-    check_output(['git', 'big', 'rm', file_])
+    git_big('rm', file_)
 
     # git should not report that there is an untracked file
     check_status(['A  .gitattributes'])
@@ -45,19 +45,19 @@ def test_remove(env):
 def test_remove_after_commit(env):
     '''Removing a file after a commit should remove the link and index entry'''
     file_ = join(env.repo_dir, 'foo')
-    open(file_, 'w').write(HELLO_CONTENT)
+    write_file(file_, HELLO_CONTENT)
 
     # git should report that the repo is dirty
     check_status(['A  .gitattributes', '?? foo'])
 
     # add the file to git-big
-    check_output(['git', 'big', 'add', file_])
+    git_big('add', file_)
 
     # make a commit
-    check_output(['git', 'commit', '-m', 'commit'])
+    check_output(['git', 'commit', '-q', '-m', 'commit'])
 
     # remove the file
-    check_output(['git', 'big', 'rm', file_])
+    git_big('rm', file_)
 
     # git should show deletions
     check_status(['D  .gitbig', 'D  foo'])
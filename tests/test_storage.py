@@ -0,0 +1,48 @@
+# Copyright (c) 2017 Vertex.AI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import print_function
+
+import pytest
+
+from git_big.storage import iter_lines
+
+REFS = [
+    '2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824',
+    '486ea46224d1bb4fb680f34f7c9ad96a8f24ec88be73ea8e5a6c65260e9cb8a7',
+    'abc',
+]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 64, 65, 66, 130, 135, 1000])
+@pytest.mark.parametrize('count', [1, 2, 3])
+def test_iter_lines(chunk_size, count):
+    '''Chunks should join to the same bytes wherever they split'''
+    lines = REFS[:count]
+    chunks = list(iter_lines(lines, chunk_size=chunk_size))
+    assert b''.join(chunks) == '\n'.join(lines).encode()
+    assert b'' not in chunks
+
+
+def test_iter_lines_exact_boundary():
+    '''A chunk filled exactly by its lines should not end in a separator'''
+    chunks = list(iter_lines(['ab', 'cd'], chunk_size=2))
+    assert chunks == [b'ab', b'\ncd']
+    assert list(iter_lines(['ab'], chunk_size=2)) == [b'ab']
+
+
+def test_iter_lines_empty():
+    '''No lines should still yield one empty chunk'''
+    assert list(iter_lines([])) == [b'']
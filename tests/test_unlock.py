@@ -14,33 +14,34 @@
 
 from __future__ import print_function
 
+import os
+import time
 from os.path import join
-from subprocess import check_call, check_output
+from subprocess import check_output
 
-from conftest import (HELLO_CONTENT, HELLO_DIGEST, check_locked_file,
-                      check_status)
-from git_big.main import fs
+from conftest import (HELLO_CONTENT, HELLO_DIGEST, WORLD_CONTENT, WORLD_DIGEST,
+                      check_locked_file, check_status, git_big, write_file)
+from git_big.main import compute_digest, fs
 
 
 def test_unlock(env):
     '''Unlocking a file should replace the symlink with a copy of the file'''
     file_ = join(env.repo_dir, 'foo')
-    open(file_, 'w').write(HELLO_CONTENT)
+    write_file(file_, HELLO_CONTENT)
 
     # git should report that the repo is dirty
     check_status(['A  .gitattributes', '?? foo'])
 
     # add the file to git-big
-    check_output(['git', 'big', 'add', file_])
+    git_big('add', file_)
 
     # git should now track the new file
     check_status(['A  .gitattributes', 'A  .gitbig', 'A  foo'])
 
     # unlock the file
-    check_output(['git', 'big', 'unlock', file_])
+    git_big('unlock', file_)
 
     # git should report that the file is untracked
-    check_call(['git', 'status'])
     check_status(['A  .gitattributes', '?? foo'])
 
     # we should have a normal file
@@ -48,31 +49,29 @@ def test_unlock(env):
     assert fs.isfile(file_)
 
     # unlocked files should be writable
-    open(file_, 'w').write('ok')
+    write_file(file_, 'ok')
 
 
 def test_unlock_one_of_two(env):
     '''Unlocking a single file out of multiple pending changes'''
     file1 = join(env.repo_dir, 'foo')
-    open(file1, 'w').write(HELLO_CONTENT)
+    write_file(file1, HELLO_CONTENT)
     file2 = join(env.repo_dir, 'bar')
-    open(file2, 'w').write(HELLO_CONTENT)
+    write_file(file2, HELLO_CONTENT)
 
     # git should report that the repo is dirty
     check_status(['A  .gitattributes', '?? bar', '?? foo'])
 
     # add the files to git-big
-    check_output(['git', 'big', 'add', file1])
-    check_output(['git', 'big', 'add', file2])
+    git_big('add', file1, file2)
 
     # git should now track the new files
     check_status(['A  .gitattributes', 'A  .gitbig', 'A  bar', 'A  foo'])
 
     # unlock the file
-    check_output(['git', 'big', 'unlock', file1])
+    git_big('unlock', file1)
 
     # git should report that file1 is untracked but file2 is still tracked
-    check_call(['git', 'status'])
     check_status(['A  .gitattributes', 'A  .gitbig', 'A  bar', '?? foo'])
 
     # we should have a normal file and a linked file
@@ -81,7 +80,7 @@ def test_unlock_one_of_two(env):
     assert fs.islink(file2)
 
     # unlocked files should be writable
-    open(file1, 'w').write('ok')
+    write_file(file1, 'ok')
 
     # locked files should remain read-only
     check_locked_file(env, file2, HELLO_DIGEST)
@@ -90,25 +89,23 @@ def test_unlock_one_of_two(env):
 def test_unlock_after_commit(env):
     '''Unlocking a file after a commit'''
     file1 = join(env.repo_dir, 'foo')
-    open(file1, 'w').write(HELLO_CONTENT)
+    write_file(file1, HELLO_CONTENT)
     file2 = join(env.repo_dir, 'bar')
-    open(file2, 'w').write(HELLO_CONTENT)
+    write_file(file2, HELLO_CONTENT)
 
     # git should report that the repo is dirty
     check_status(['A  .gitattributes', '?? bar', '?? foo'])
 
     # add the files to git-big
-    check_output(['git', 'big', 'add', file1])
-    check_output(['git', 'big', 'add', file2])
+    git_big('add', file1, file2)
 
     # make a commit
-    check_output(['git', 'commit', '-m', 'commit'])
+    check_output(['git', 'commit', '-q', '-m', 'commit'])
 
     # unlock the file
-    check_output(['git', 'big', 'unlock', file1])
+    git_big('unlock', file1)
 
     # git should report that file1 is deleted and untracked but file2 is still tracked
-    check_call(['git', 'status'])
     check_status(['M  .gitbig', 'D  foo', '?? foo'])
 
     # we should have a normal file and a linked file
@@ -117,14 +114,72 @@ def test_unlock_after_commit(env):
     assert fs.islink(file2)
 
     # unlocked files should be writable
-    open(file1, 'w').write('ok')
+    write_file(file1, 'ok')
 
     # locked files should remain read-only
     check_locked_file(env, file2, HELLO_DIGEST)
 
     # save the change
-    check_output(['git', 'big', 'add', file1])
+    git_big('add', file1)
 
     # see that the file is now modified
-    check_call(['git', 'status'])
     check_status(['M  .gitbig', 'M  foo'])
+
+
+def count_digests(monkeypatch):
+    '''Record the paths that git-big hashes'''
+    hashed = []
+
+    def counting(path, rel_path=None):
+        hashed.append(rel_path)
+        return compute_digest(path, rel_path)
+
+    monkeypatch.setattr('git_big.main.compute_digest', counting)
+    return hashed
+
+
+def age_stat_cache(env):
+    '''Pretend the stat cache was saved well after the files it describes'''
+    path = join(env.repo_dir, '.git', 'git-big', 'stat-cache')
+    now = time.time() + 60
+    os.utime(path, (now, now))
+
+
+def test_unlock_add_unchanged(env, monkeypatch):
+    '''Adding an unlocked file that was not modified should not rehash it'''
+    file_ = join(env.repo_dir, 'foo')
+    write_file(file_, HELLO_CONTENT)
+    git_big('add', file_)
+    git_big('unlock', file_)
+    age_stat_cache(env)
+
+    hashed = count_digests(monkeypatch)
+    git_big('add', file_)
+
+    assert hashed == []
+    check_status(['A  .gitattributes', 'A  .gitbig', 'A  foo'])
+    check_locked_file(env, file_, HELLO_DIGEST)
+
+
+def test_unlock_edit_add(env, monkeypatch):
+    '''Adding an unlocked file that was modified should rehash it'''
+    file_ = join(env.repo_dir, 'foo')
+    write_file(file_, HELLO_CONTENT)
+    git_big('add', file_)
+    git_big('unlock', file_)
+    age_stat_cache(env)
+
+    # same size and mtime, so only the ctime gives the edit away
+    st = os.stat(file_)
+    write_file(file_, WORLD_CONTENT)
+    os.utime(file_, (st.st_atime, st.st_mtime))
+    while os.stat(file_).st_ctime == st.st_ctime:
+        time.sleep(0.01)
+        os.chmod(file_, st.st_mode)
+
+    hashed = count_digests(monkeypatch)
+    git_big('add', file_)
+
+    assert hashed == ['foo']
+    check_status(['A  .gitattributes', 'A  .gitbig', 'A  foo'])
+    check_locked_file(env, file_, WORLD_DIGEST)
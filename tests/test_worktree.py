@@ -20,7 +20,8 @@ from subprocess import check_output
 
 # pylint: disable=unused-argument,W0621
 from conftest import (HELLO_CONTENT, HELLO_DIGEST, check_locked_file,
-                      check_status)
+                      check_status, git_big,
+                      write_file)
 
 
 def test_create(env):
@@ -28,9 +29,9 @@ def test_create(env):
 
     # add a file and commit
     file_ = join(env.repo_dir, 'foo')
-    open(file_, 'w').write(HELLO_CONTENT)
-    check_output(['git', 'big', 'add', file_])
-    check_output(['git', 'commit', '-m', 'message'])
+    write_file(file_, HELLO_CONTENT)
+    git_big('add', file_)
+    check_output(['git', 'commit', '-q', '-m', 'message'])
 
     # create a worktree
     check_output(['git', 'worktree', 'add', 'worktree'])
@@ -39,7 +40,7 @@ def test_create(env):
     os.chdir('worktree')
 
     # pull big files into worktree
-    check_output(['git', 'big', 'pull'])
+    git_big('pull')
 
     # verify link is working
     check_locked_file(env, 'foo', HELLO_DIGEST, '.')
@@ -52,7 +53,7 @@ def test_add(env):
     touched = join(env.repo_dir, 'xxx')
     open(touched, 'w').close()
     check_output(['git', 'add', touched])
-    check_output(['git', 'commit', '-m', 'commit'])
+    check_output(['git', 'commit', '-q', '-m', 'commit'])
 
     # create a worktree
     check_output(['git', 'worktree', 'add', 'worktree'])
@@ -60,13 +61,13 @@ def test_add(env):
     # change directory into the worktree
     os.chdir('worktree')
 
-    open('foo', 'w').write(HELLO_CONTENT)
+    write_file('foo', HELLO_CONTENT)
 
     # git should report that the repo is dirty
     check_status(['?? foo'])
 
     # add the file
-    check_output(['git', 'big', 'add', 'foo'])
+    git_big('add', 'foo')
 
     # status should show two pending changes
     check_status(['A  .gitbig', 'A  foo'])